@@ -3,39 +3,58 @@ Authors: Nastia Merlits, Kostia Balitsky
 """
 
 import random
+import sys
 
+import numpy
+
+import geometry
+import instrument
+import runs
 from settings import HORIZONTAL, VERTICAL, EPS
 from structures import SegmentSequence, Glyph, Line, Point, Circle
 
 
 class Converter(object):
+    """
+    Transpose a glyph: turn an H-glyph into a V-glyph and vice versa.
+
+    The conversion never expands runs into pixels. A pixel starts an
+    output run when it is covered on its level but not on the previous
+    one and ends an output run when it is not covered on the next level.
+    Both sets are found by sweeping run endpoints of adjacent levels and
+    their number equals the number of output runs, so the cost is
+    proportional to the number of input plus output runs. Output runs are
+    ordered by (level, start).
+    """
+
     def __init__(self):
         pass
 
+    @instrument.timed('convert')
     def run(self, glyph):
-        if glyph.orientation == HORIZONTAL:
-            level_coord = 1
-        else:
-            level_coord = 0
-        dim_coord = 1 - level_coord
+        level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+        current = (level, start, stop)
+
+        heads = runs.combine(current, (level + 1, start, stop), runs.and_not)
+        tails = runs.combine(current, (level - 1, start, stop), runs.and_not)
 
-        seqs = {}
-        for line in glyph.lines:
-            for point in xrange(line[dim_coord], line[dim_coord] + line.l):
-                seq = seqs.get(point, SegmentSequence())
-                seq.add_point(line[level_coord])
-                seqs[point] = seq
+        head_index, head_pos = runs.expand(heads[1], heads[2])
+        head_level = heads[0][head_index]
+        tail_index, tail_pos = runs.expand(tails[1], tails[2])
+        tail_level = tails[0][tail_index]
 
-        level_coord, dim_coord = dim_coord, level_coord
-        result = Glyph(orientation=not glyph.orientation)
-        for level, sequence in seqs.items():
-            for segment in sequence:
-                line = Line(l=len(segment))
-                line[level_coord] = level
-                line[dim_coord] = segment.start
-                result.add_line(line)
+        # Along every new level heads and tails alternate, so sorting both
+        # by (new level, old level) pairs them up.
+        head_order = numpy.lexsort((head_level, head_pos))
+        tail_order = numpy.lexsort((tail_level, tail_pos))
+        new_level = head_pos[head_order]
+        new_start = head_level[head_order]
+        new_stop = tail_level[tail_order] + 1
 
-        return result
+        instrument.count('runs', len(glyph))
+        instrument.count('converted_runs', len(new_level))
+        return runs.to_glyph(not glyph.orientation,
+                             new_level, new_start, new_stop)
 
 
 class ConvexHull(object):
@@ -72,12 +91,67 @@ class ConvexHull(object):
         If it is so, the return value is > 0, if the turn is clockwise, the 
         return value is < 0. If vectors are collinear, the return value is 0.
         """
-        return self.cross(Point(p2.x - p1.x, p2.y - p1.y), Point(p3.x - p1.x, p3.y - p1.y))
+        return geometry.orient(p1.x, p1.y, p2.x, p2.y, p3.x, p3.y)
+
+
+class GlyphConvexHull(ConvexHull):
+    """
+    Convex hull of all pixels of a run-encoded glyph in O(runs) for runs
+    in order, as corpus glyphs are; other glyphs get their runs sorted.
+
+    Only the first and the last pixel of every level can be a hull vertex,
+    so the glyph is reduced to at most two candidates per level. Visiting
+    levels in order already gives candidates sorted by (level, position),
+    hence the upper and lower chains are built by the monotone chain
+    algorithm without any general sort. Points go counterclockwise, as in
+    ``ConvexHull``.
+    """
+
+    @instrument.timed('hull')
+    def __init__(self, glyph):
+        level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+        if len(level) == 0:
+            self.points = []
+            return
+        # runs are sorted by level, every level is a block of them
+        blocks = numpy.flatnonzero(numpy.concatenate(
+            [[True], level[1:] != level[:-1]]))
+        levels = level[blocks].tolist()
+        first = numpy.minimum.reduceat(start, blocks).tolist()
+        last = (numpy.maximum.reduceat(stop, blocks) - 1).tolist()
+
+        candidates = []
+        for lvl, lo, hi in zip(levels, first, last):
+            candidates.append((lvl, lo))
+            if hi != lo:
+                candidates.append((lvl, hi))
+
+        instrument.count('points_tested', len(candidates))
+        lower = self.chain(candidates)
+        upper = self.chain(reversed(candidates))
+        hull = lower[:-1] + upper[:-1] or lower
+        if glyph.orientation == HORIZONTAL:
+            # candidates are (y, x): the chains went clockwise in (x, y)
+            self.points = [Point(x, y) for y, x in reversed(hull)]
+        else:
+            self.points = [Point(x, y) for x, y in hull]
+        instrument.count('hull_size', len(self.points))
+
+    def chain(self, candidates):
+        chain = []
+        for ax, ay in candidates:
+            while len(chain) >= 2:
+                (ox, oy), (bx, by) = chain[-2], chain[-1]
+                if (bx - ox) * (ay - oy) - (by - oy) * (ax - ox) > 0:
+                    break
+                chain.pop()
+            chain.append((ax, ay))
+        return chain
 
 
 class BaseEnclosingCircle(object):
     def distance(self, p1, p2):
-        return ((p1.x - p2.x) ** 2 + (p1.y - p2.y) ** 2) ** 0.5
+        return geometry.distance(p1.x, p1.y, p2.x, p2.y)
 
     def middle(self, *points):
         x, y = 0, 0
@@ -87,91 +161,43 @@ class BaseEnclosingCircle(object):
         return Point(x, y)
 
     def circle_on_diameter(self, p1, p2):
-        center = self.middle(p1, p2)
-        rad = self.distance(p1, p2) / 2.
-        return Circle(center.x, center.y, rad)
+        return Circle((p1.x + p2.x) / 2., (p1.y + p2.y) / 2.,
+                      self.distance(p1, p2) / 2.)
 
     def circle_on_triangle(self, p1, p2, p3):
-        a = self.distance(p1, p2)
-        b = self.distance(p1, p3)
-        c = self.distance(p2, p3)
-        p = (a + b + c) / 2.
-        s = (p * (p - a) * (p - b) * (p - c)) ** 0.5
-        try:
-            rad = a*b*c / 4. / s
-        except ZeroDivisionError, e:
-            print 'Points: ', p1, p2, p3
-            print 'Sides: ', a, b, c
-            print 'Half-perim: ', p
-            raise
-
-        alpha_a = a * a / 8. / s / s * ((p1 - p3) * (p2 - p3))
-        alpha_b = b * b / 8. / s / s * ((p1 - p2) * (p3 - p2))
-        alpha_c = c * c / 8. / s / s * ((p2 - p1) * (p3 - p1))
-
-        center = p3 * alpha_a + p2 * alpha_b + p1 * alpha_c
-
-        return Circle(center.x, center.y, rad)
+        x, y, r2 = geometry.circumcircle(p1.x, p1.y, p2.x, p2.y, p3.x, p3.y)
+        return Circle(x, y, r2 ** 0.5)
 
     def is_enclosing(self, circle, points):
         return all([point in circle for point in points])
 
 
 class LinearEnclosingCircle(BaseEnclosingCircle):
-    def __init__(self, points):
-        print points
-        pointnum = len(points)
+    """
+    Minimum enclosing circle in expected O(n) time.
+
+    Iterative form of Welzl's randomized incremental algorithm: points are
+    shuffled once and then added one by one; whenever a point falls out of
+    the current circle, the circle is rebuilt with that point (and then
+    possibly a second one) fixed on its boundary (see
+    ``geometry.min_circle``). Circles are kept as plain floats, so no
+    objects are allocated in the inner loops.
+
+    ``seed`` makes the shuffle, and therefore ``iterations``, reproducible.
+    """
+
+    @instrument.timed('circle')
+    def __init__(self, points, seed=None):
         self.iterations = 0
-        #random.shuffle(points)
-        self.circle = self.build_circle(points, [])
-        print 'LEC required %r iterations on %r points' % (self.iterations, pointnum)
-        if self.is_enclosing(self.circle, points):
-            print 'Circle is actually enclosing'
-        else:
-            print 'Circle is not an enclosing one'
-
-    def by_bound(self, points_on_bound):
-        # print 'BB: ', points_on_bound
-        if len(points_on_bound) == 0:
-            #print 'Building empty'
-            return Circle(0, 0, 0)
-        if len(points_on_bound) == 1:
-            #print 'Buildin on center'
-            return Circle(points_on_bound[0].x, points_on_bound[0].y, 0)
-        if len(points_on_bound) == 2:
-            #print 'Building on diameter'
-            return self.circle_on_diameter(points_on_bound[0], points_on_bound[1])
-        #print 'Building on triangle'
-        return self.circle_on_triangle(points_on_bound[0],
-                                       points_on_bound[1],
-                                       points_on_bound[2])
-
-    def build_circle(self, points, support):
-        # print 'BC: ', points, support
-        self.iterations += 1
-
-        if points:
-            ind = random.randint(0, len(points) - 1)
-            points[ind], points[-1] = points[-1], points[ind]
-            
-            circle = None
-            if len(support) == 3:
-                circle = self.by_bound(support)
-            
-            if not circle:
-                circle = self.build_circle(points[:-1], support)
-                
-            
-            if points[-1] in circle:
-                return circle
-            else:
-                support.append(points[-1])
-                if len(support) > 3:
-                    points = [support[0]] + points
-                    support = support[1:]
-                return self.build_circle(points[:-1], support)
-        else:
-            return self.by_bound(support)
+        coords = [(float(point.x), float(point.y)) for point in points]
+        if not coords:
+            self.circle = Circle(0, 0, 0)
+            return
+        random.Random(seed).shuffle(coords)
+        cx, cy, r2, self.iterations = geometry.min_circle(coords)
+        self.circle = Circle(cx, cy, r2 ** 0.5)
+        instrument.count('points_tested', len(coords))
+        instrument.count('iterations', self.iterations)
 
 
 class NaiveEnclosingCircle(BaseEnclosingCircle):
@@ -216,11 +242,40 @@ class NaiveEnclosingCircle(BaseEnclosingCircle):
             raise Exception('No idea how, but we did not find an enclosing circle.')
 
 
+def compare_circles(records, tolerance=1e-6, seed=None):
+    """
+    Cross-check ``LinearEnclosingCircle`` against ``NaiveEnclosingCircle``
+    on the convex hulls of corpus records.
+
+    Yield ``(index, naive, linear)`` for every record whose circles
+    differ by more than ``tolerance`` in any of x, y or r. The circles
+    stored in corpus rows are not used: they enclose the glyphs but are
+    not always minimal.
+    """
+    for index, record in enumerate(records):
+        hull = GlyphConvexHull(record.glyph).points
+        if not hull:
+            continue
+        naive = NaiveEnclosingCircle(hull).circle
+        linear = LinearEnclosingCircle(hull, seed=seed).circle
+        if max(abs(naive.x - linear.x), abs(naive.y - linear.y),
+               abs(naive.r - linear.r)) > tolerance:
+            yield index, naive, linear
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from container import open_corpus
+        corpus = open_corpus(sys.argv[1])
+        mismatches = list(compare_circles(corpus))
+        for index, naive, linear in mismatches:
+            print '%i: naive %r, linear %r' % (index, naive, linear)
+        print '%i of %i circles differ' % (len(mismatches), len(corpus))
+        exit()
+
     points = [Point(3, 11), Point(10, 4), Point(16, 1), Point(20, 0)]
     lc = LinearEnclosingCircle(points)
-
-    exit()
+    print lc.circle
 
     points = [Point(0, 1), Point(0, 0), Point(1, 1), Point(1, 0), Point(.5, .5),
               Point(.7, .7), Point(.5, 1), Point(1, .5), Point(.5, -1)]
@@ -0,0 +1,225 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Headless feature extraction over a whole glyph corpus.
+
+Every glyph goes through the Converter -> convex hull -> enclosing circle
+pipeline and produces one feature row. Work is split into chunks of row
+indices; worker processes open the corpus themselves and fetch rows by
+index, so only indices and feature rows travel between processes. At most
+a fixed number of chunks is in flight at a time and results are written
+in input order, which keeps memory bounded for corpora of any size.
+
+Usage:
+
+  ``$ python batch.py input/glyphs.txt features.csv --processes 32``
+
+Use a ``.npz`` output file name to get NumPy arrays instead of CSV. The
+corpus may be a text file or a binary container (see ``container``).
+With ``--cache results.db`` results of glyphs seen before, in this or any
+earlier run, are taken from a shared ``cache.ResultCache``.
+"""
+
+import argparse
+import collections
+import csv
+import itertools
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy
+
+from algorithm import Converter, GlyphConvexHull, LinearEnclosingCircle
+from cache import ResultCache, glyph_digest
+from container import open_corpus
+from moments import Moments
+from settings import HORIZONTAL, VERTICAL
+
+FIELDS = ('index', 'encoding', 'runs', 'converted_runs', 'hull_size',
+          'circle_x', 'circle_y', 'circle_r',
+          'bbox_x0', 'bbox_y0', 'bbox_x1', 'bbox_y1',
+          'area', 'centroid_x', 'centroid_y', 'angle',
+          'hu1', 'hu2', 'hu3', 'hu4', 'hu5', 'hu6', 'hu7',
+          'convert_time', 'hull_time', 'circle_time')
+
+
+def extract_features(index, record, cache=None):
+    glyph = record.glyph
+
+    started = time.time()
+    if cache is None:
+        converted = Converter().run(glyph)
+        converted_at = time.time()
+        hull = GlyphConvexHull(glyph).points
+        hull_at = time.time()
+        circle = LinearEnclosingCircle(hull, seed=index).circle
+    else:
+        digest = glyph_digest(glyph)
+        converted = cache.convert(glyph, digest)
+        converted_at = time.time()
+        hull = cache.hull(glyph, digest)
+        hull_at = time.time()
+        circle = cache.circle(glyph, digest, seed=index)
+    circle_at = time.time()
+    moments = Moments(glyph)
+    centroid = moments.centroid or (0., 0.)
+
+    return ((index, record.encoding, len(glyph), len(converted), len(hull),
+             circle.x, circle.y, circle.r) + tuple(record.bbox) +
+            (moments.area, ) + tuple(centroid) + (moments.angle, ) +
+            tuple(moments.hu) +
+            (converted_at - started, hull_at - converted_at,
+             circle_at - hull_at))
+
+
+_corpus = None
+_cache = None
+
+
+def _open_corpus(path, orientation, cache_path=None):
+    global _corpus, _cache
+    _corpus = open_corpus(path, orientation)
+    _cache = ResultCache(path=cache_path) if cache_path else None
+
+
+def _process_chunk(bounds):
+    start, stop = bounds
+    return [extract_features(index, _corpus[index], _cache)
+                for index in xrange(start, stop)]
+
+
+def run_batch(path, processes=None, chunksize=256, orientation=VERTICAL,
+              cache_path=None):
+    """
+    Yield feature rows of every glyph of a corpus in input order.
+
+    ``cache_path`` names an SQLite file shared by all workers as the
+    on-disk tier of their result caches.
+    """
+    with open_corpus(path, orientation) as corpus:
+        total = len(corpus)
+    chunks = [(start, min(start + chunksize, total))
+                for start in xrange(0, total, chunksize)]
+
+    if processes == 1:
+        _open_corpus(path, orientation, cache_path)
+        for chunk in chunks:
+            for row in _process_chunk(chunk):
+                yield row
+        return
+
+    pool = multiprocessing.Pool(processes, _open_corpus,
+                                (path, orientation, cache_path))
+    try:
+        chunks = iter(chunks)
+        pending = collections.deque()
+
+        def submit():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(pool.apply_async(_process_chunk, (chunk, )))
+
+        for _ in xrange(2 * (processes or multiprocessing.cpu_count())):
+            submit()
+        while pending:
+            rows = pending.popleft().get()
+            submit()
+            for row in rows:
+                yield row
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def write_csv(rows, output):
+    writer = csv.writer(output)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(row)
+
+
+def write_npz(rows, path, chunksize=65536):
+    """
+    Save rows column-wise as one array per field.
+
+    Rows are taken ``chunksize`` at a time and every chunk is spilled
+    into one temporary file per field, so memory does not grow with the
+    corpus; the arrays are put together in the archive at the end.
+    """
+    directory = tempfile.mkdtemp()
+    spills = [open(os.path.join(directory, field), 'w+b')
+                for field in FIELDS]
+    try:
+        dtypes = [numpy.dtype(float)] * len(FIELDS)
+        total = chunks = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunksize))
+            if not chunk:
+                break
+            for index, column in enumerate(zip(*chunk)):
+                array = numpy.array(column)
+                numpy.save(spills[index], array)
+                dtypes[index] = array.dtype if not chunks else\
+                    numpy.promote_types(dtypes[index], array.dtype)
+            total += len(chunk)
+            chunks += 1
+
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED,
+                             allowZip64=True) as archive:
+            for field, spill, dtype in zip(FIELDS, spills, dtypes):
+                member = os.path.join(directory, field + '.npy')
+                with open(member, 'wb') as output:
+                    numpy.lib.format.write_array_header_1_0(output, {
+                        'descr': numpy.lib.format.dtype_to_descr(dtype),
+                        'fortran_order': False,
+                        'shape': (total, )})
+                    spill.seek(0)
+                    for _ in xrange(chunks):
+                        array = numpy.load(spill).astype(dtype)
+                        output.write(array.tostring())
+                archive.write(member, field + '.npy')
+                os.remove(member)
+    finally:
+        for spill in spills:
+            spill.close()
+        shutil.rmtree(directory)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extract glyph features from a corpus file.")
+    parser.add_argument('corpus', help="text corpus or binary container")
+    parser.add_argument('output', help="CSV file, '-' for stdout, "
+                                       "or a file ending with .npz")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument('--chunksize', type=int, default=256,
+                        help="glyphs per work item")
+    parser.add_argument('--horizontal', action='store_true',
+                        help="rows without an orientation flag "
+                             "are horizontal")
+    parser.add_argument('--cache', metavar='PATH', default=None,
+                        help="SQLite file keeping results between runs")
+    args = parser.parse_args(argv)
+
+    orientation = HORIZONTAL if args.horizontal else VERTICAL
+    rows = run_batch(args.corpus, args.processes, args.chunksize,
+                     orientation, args.cache)
+    if args.output.endswith('.npz'):
+        write_npz(rows, args.output)
+    elif args.output == '-':
+        write_csv(rows, sys.stdout)
+    else:
+        with open(args.output, 'wb') as output:
+            write_csv(rows, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Benchmarks of the glyph algorithms on synthetic glyphs.
+
+Every generator builds a glyph of roughly the requested number of pixels
+straight from run arrays, so glyphs of 10^6 pixels are cheap to make:
+
+    ``blob``       noisy disc with a few gaps, like a real glyph
+    ``tiny``       checkerboard, every run is one pixel long
+    ``huge``       four runs holding all the pixels
+    ``disc``       exact digital disc, the largest possible hull
+    ``collinear``  diagonal band, all run ends on two parallel lines
+
+Every operation is timed on every generator and size, taking the best of
+a few repeats. The slope of log(time) against log(pixels) estimates the
+complexity of an operation; the slope against the number of runs is
+printed as well, since most algorithms here never look at single pixels.
+Operations too slow for a case (the general ``ConvexHull`` on many
+points, ``NaiveEnclosingCircle`` on large hulls, rendering of huge
+bounding boxes) are skipped for it.
+
+Results can be saved as a JSON baseline; a later run compared against it
+fails when a case got slower than the threshold allows or when its result
+changed.
+
+Usage:
+
+  ``$ python bench.py --max-size 100000 --save baseline.json``
+  ``$ python bench.py --max-size 100000 --compare baseline.json``
+"""
+
+import argparse
+import json
+import math
+import sys
+import timeit
+
+import numpy
+
+import raster
+import runs
+from algorithm import (Converter, ConvexHull, GlyphConvexHull,
+                       LinearEnclosingCircle, NaiveEnclosingCircle)
+from settings import VERTICAL
+from structures import Point
+
+
+def blob(pixels, seed=0):
+    rng = numpy.random.RandomState(seed)
+    radius = max(1, int(math.sqrt(pixels / math.pi)))
+    level = numpy.arange(-radius, radius + 1)
+    half = numpy.sqrt(numpy.maximum(radius ** 2 - level ** 2, 0))
+    noise = numpy.cumsum(rng.normal(0, 0.05, len(level)))
+    half = numpy.maximum(half * (1 + noise - noise.mean()), 0).astype(int)
+    start, stop = -half, half + 1
+    # cut a gap into some of the levels
+    cut = (rng.random_sample(len(level)) < 0.2) & (half > 4)
+    gap = half[cut] / 4
+    level = numpy.concatenate([level[~cut], level[cut], level[cut]])
+    start, stop = (numpy.concatenate([start[~cut], start[cut], gap]),
+                   numpy.concatenate([stop[~cut], -gap, stop[cut]]))
+    return _glyph(level + radius, start + radius, stop + radius)
+
+
+def tiny(pixels, seed=0):
+    side = max(1, int(math.sqrt(2 * pixels)))
+    level, index = numpy.divmod(numpy.arange(side * ((side + 1) / 2)),
+                                (side + 1) / 2)
+    start = 2 * index + level % 2
+    keep = start < side
+    return _glyph(level[keep], start[keep], start[keep] + 1)
+
+
+def huge(pixels, seed=0):
+    rng = numpy.random.RandomState(seed)
+    length = max(1, pixels / 4)
+    start = rng.randint(0, max(1, length / 10), 4)
+    return _glyph(numpy.arange(4), start, start + length)
+
+
+def disc(pixels, seed=0):
+    radius = max(0, int(math.sqrt(pixels / math.pi)))
+    level = numpy.arange(-radius, radius + 1)
+    half = numpy.floor(numpy.sqrt(radius ** 2 - level ** 2)).astype(int)
+    return _glyph(level + radius, radius - half, radius + half + 1)
+
+
+def collinear(pixels, seed=0, width=8):
+    level = numpy.arange(max(1, pixels / width))
+    return _glyph(level, level, level + width)
+
+
+def _glyph(level, start, stop):
+    return runs.to_glyph(VERTICAL, numpy.asarray(level),
+                         numpy.asarray(start), numpy.asarray(stop))
+
+
+GENERATORS = {
+    'blob': blob,
+    'tiny': tiny,
+    'huge': huge,
+    'disc': disc,
+    'collinear': collinear,
+}
+
+
+class Case(object):
+    """Input of one benchmark: a glyph with its hull precomputed."""
+
+    def __init__(self, generator, size):
+        self.generator = generator
+        self.size = size
+        self.glyph = GENERATORS[generator](size)
+        self.pixels = int(self.glyph.l.sum())
+        self.hull = GlyphConvexHull(self.glyph).points
+        level, start, stop = runs.from_glyph(self.glyph)
+        self.area = ((level.ptp() + 1) * (stop.max() - start.min())
+                        if len(level) else 0)
+
+    def endpoints(self):
+        level, start, stop = runs.from_glyph(self.glyph)
+        level = level.tolist()
+        return ([Point(x, y) for x, y in zip(level, start.tolist())] +
+                [Point(x, y) for x, y in zip(level, (stop - 1).tolist())])
+
+
+def _convert(case):
+    return len(Converter().run(case.glyph))
+
+
+def _hull(case):
+    return len(GlyphConvexHull(case.glyph).points)
+
+
+def _hull_points(case, points):
+    return len(ConvexHull(points).points)
+
+
+def _linear_circle(case):
+    return round(LinearEnclosingCircle(case.hull, seed=0).circle.r, 6)
+
+
+def _naive_circle(case):
+    return round(NaiveEnclosingCircle(list(case.hull)).circle.r, 6)
+
+
+def _render(case):
+    return int(raster.rasterize_glyph(case.glyph).sum() / raster.INK)
+
+
+# name: (function, setup giving fresh input per repeat, applies to the case)
+OPERATIONS = {
+    'convert': (_convert, None, lambda case: True),
+    'hull': (_hull, None, lambda case: True),
+    'hull_points': (_hull_points, Case.endpoints,
+                    lambda case: len(case.glyph) <= 10 ** 4),
+    'circle_linear': (_linear_circle, None, lambda case: True),
+    'circle_naive': (_naive_circle, None,
+                     lambda case: 3 <= len(case.hull) <= 40),
+    'render': (_render, None, lambda case: case.area <= 10 ** 7),
+}
+
+
+def measure(case, operation, repeat=3):
+    """Return ``(best time, result)`` of an operation or None."""
+    function, setup, applies = OPERATIONS[operation]
+    if not applies(case):
+        return None
+    best, result = None, None
+    for _ in xrange(repeat):
+        # untimed, and again for every repeat: ConvexHull sorts its input
+        # in place and would get sorted points from the second run on
+        args = (case, ) if setup is None else (case, setup(case))
+        started = timeit.default_timer()
+        result = function(*args)
+        elapsed = timeit.default_timer() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_benchmarks(generators, operations, sizes, repeat=3, output=None):
+    """
+    Return ``{"generator/operation/size": {...}}`` with the time, result,
+    pixels and runs of every applicable case.
+    """
+    results = {}
+    for generator in generators:
+        for size in sizes:
+            case = Case(generator, size)
+            for operation in operations:
+                measured = measure(case, operation, repeat)
+                if measured is None:
+                    continue
+                key = '%s/%s/%i' % (generator, operation, size)
+                results[key] = {'time': measured[0], 'result': measured[1],
+                                'pixels': case.pixels,
+                                'runs': len(case.glyph)}
+                if output is not None:
+                    output.write('%-36s %12.6f s  %9i px %8i runs\n' %
+                                 (key, measured[0], case.pixels,
+                                  len(case.glyph)))
+    return results
+
+
+def scaling(results, axis='pixels'):
+    """
+    Return ``{(generator, operation): slope}`` of log(time) against
+    log(``axis``), ``'pixels'`` or ``'runs'``, fitted over all sizes.
+    """
+    series = {}
+    for key, value in results.items():
+        generator, operation, size = key.split('/')
+        series.setdefault((generator, operation), []).append(
+            (value[axis], value['time']))
+    slopes = {}
+    for name, points in series.items():
+        points = [(count, time) for count, time in points
+                    if count > 0 and time > 0]
+        if len(set(count for count, time in points)) < 2:
+            continue
+        counts, times = numpy.log(numpy.array(points, dtype=float)).T
+        slopes[name] = numpy.polyfit(counts, times, 1)[0]
+    return slopes
+
+
+def compare(results, baseline, threshold=1.5, noise=1e-3):
+    """
+    Yield ``(key, message)`` for every case slower than ``threshold``
+    times its baseline or with a different result. Cases faster than
+    ``noise`` seconds in both runs are not compared by time.
+    """
+    for key in sorted(set(results) & set(baseline)):
+        new, old = results[key], baseline[key]
+        if new['result'] != old['result']:
+            yield key, 'result %r, baseline %r' % (new['result'],
+                                                   old['result'])
+        elif max(new['time'], old['time']) > noise and\
+                new['time'] > threshold * old['time']:
+            yield key, '%.6f s, baseline %.6f s (x%.2f)' % (
+                new['time'], old['time'], new['time'] / old['time'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time glyph algorithms on synthetic glyphs.")
+    parser.add_argument('--generators', nargs='+', default=sorted(GENERATORS),
+                        choices=sorted(GENERATORS))
+    parser.add_argument('--operations', nargs='+', default=sorted(OPERATIONS),
+                        choices=sorted(OPERATIONS))
+    parser.add_argument('--max-size', type=int, default=10 ** 6,
+                        help="largest glyph in pixels, sizes go by x10 "
+                             "from 100")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='JSON',
+                        help="write results as a baseline")
+    parser.add_argument('--compare', metavar='JSON',
+                        help="compare results with a baseline")
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    sizes = []
+    size = 100
+    while size <= args.max_size:
+        sizes.append(size)
+        size *= 10
+    results = run_benchmarks(args.generators, args.operations, sizes,
+                             args.repeat, sys.stdout)
+
+    print
+    print 'Scaling exponents (time ~ pixels ** k, time ~ runs ** k):'
+    by_runs = scaling(results, 'runs')
+    for (generator, operation), slope in sorted(scaling(results).items()):
+        print '  %-10s %-14s %5.2f %7.2f' % (
+            generator, operation, slope,
+            by_runs.get((generator, operation), float('nan')))
+
+    if args.save:
+        with open(args.save, 'w') as output:
+            json.dump(results, output, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = list(compare(results, json.load(baseline),
+                                       args.threshold))
+        print
+        for key, message in regressions:
+            print 'REGRESSION %s: %s' % (key, message)
+        print '%i regressions' % (len(regressions), )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Boolean operations on glyphs without expanding them into pixels.
+
+Both glyphs are turned into level-form runs (see ``runs``) and swept
+together along every level, so the cost depends on the number of runs
+only. Results are normalized: on every level they form an ordered set of
+disjoint, non-adjacent runs, as a ``structures.SegmentSequence`` would
+hold them. A result has the orientation of the first glyph; the second
+one is converted first when the orientations differ.
+
+Every operation has an ``*_area`` counterpart returning the number of
+pixels of the result without building it.
+"""
+
+import numpy
+
+import runs
+from algorithm import Converter
+
+
+KEEP = {
+    'union': numpy.logical_or,
+    'intersection': numpy.logical_and,
+    'difference': runs.and_not,
+    'symmetric_difference': numpy.logical_xor,
+}
+
+
+def _operands(first, second):
+    if second.orientation != first.orientation:
+        second = Converter().run(second)
+    return runs.from_glyph(first), runs.from_glyph(second)
+
+
+def combine(operation, first, second):
+    """Apply the operation named in ``KEEP`` to two glyphs."""
+    a, b = _operands(first, second)
+    return runs.to_glyph(first.orientation,
+                         *runs.combine(a, b, KEEP[operation]))
+
+
+def combined_area(operation, first, second):
+    """Return the pixel count of ``combine(operation, first, second)``."""
+    a, b = _operands(first, second)
+    return runs.combined_length(a, b, KEEP[operation])
+
+
+def union(first, second):
+    return combine('union', first, second)
+
+
+def intersection(first, second):
+    return combine('intersection', first, second)
+
+
+def difference(first, second):
+    return combine('difference', first, second)
+
+
+def symmetric_difference(first, second):
+    return combine('symmetric_difference', first, second)
+
+
+def union_area(first, second):
+    return combined_area('union', first, second)
+
+
+def intersection_area(first, second):
+    return combined_area('intersection', first, second)
+
+
+def difference_area(first, second):
+    return combined_area('difference', first, second)
+
+
+def symmetric_difference_area(first, second):
+    return combined_area('symmetric_difference', first, second)
+
+
+def area(glyph):
+    """Return the number of pixels of a glyph, overlapping runs or not."""
+    level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+    return int((stop - start).sum())
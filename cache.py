@@ -0,0 +1,168 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Content-addressed cache of per-glyph results.
+
+A glyph is identified by the SHA-1 of its normalized runs and its
+orientation, so glyphs covering the same pixels share their entries no
+matter how their runs were split or ordered. Every computation has a name
+and a version in ``VERSIONS``; both are part of the key, and bumping a
+version makes all older entries unreachable (``ResultCache.purge`` then
+drops them from disk).
+
+Results live in an in-memory LRU tier bounded by the number of entries
+and, optionally, in an SQLite file shared by any number of processes.
+Cached values are shared between callers and must not be modified.
+"""
+
+import collections
+import cPickle as pickle
+import hashlib
+import os
+import sqlite3
+
+import numpy
+
+import runs
+from algorithm import Converter, GlyphConvexHull, LinearEnclosingCircle
+
+VERSIONS = {
+    'convert': 2,
+    'hull': 2,
+    'circle': 2,
+}
+
+
+def glyph_digest(glyph):
+    """Return the hex digest identifying the pixels of a glyph."""
+    level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+    digest = hashlib.sha1('H' if not glyph.orientation else 'V')
+    for array in (level, start, stop):
+        digest.update(numpy.ascontiguousarray(array, dtype='<i8').tostring())
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    Two-tier cache of ``Converter``, hull and enclosing circle results.
+
+    ``capacity`` bounds the number of entries kept in memory. With a
+    ``path`` entries are also written to an SQLite database there; worker
+    processes may open the same path, each connection is opened lazily in
+    the process using it.
+    """
+
+    def __init__(self, capacity=4096, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        self.disk_hits = collections.Counter()
+        self._memory = collections.OrderedDict()
+        self._connection = None
+        self._pid = None
+
+    def _database(self):
+        if self.path is None:
+            return None
+        if self._pid != os.getpid():
+            # sqlite connections must not cross a fork
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, name TEXT, version INTEGER, "
+                "value BLOB)")
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key, value):
+        memory = self._memory
+        memory[key] = value
+        if len(memory) > self.capacity:
+            memory.popitem(last=False)
+
+    def lookup(self, name, digest, compute):
+        """
+        Return the cached result of computation ``name`` for a glyph
+        digest, calling ``compute()`` and storing its result on a miss.
+        """
+        key = '%s:%i:%s' % (name, VERSIONS[name], digest)
+        memory = self._memory
+        if key in memory:
+            value = memory.pop(key)
+            memory[key] = value
+            self.hits[name] += 1
+            return value
+
+        database = self._database()
+        if database is not None:
+            row = database.execute("SELECT value FROM results WHERE key = ?",
+                                   (key, )).fetchone()
+            if row is not None:
+                value = pickle.loads(str(row[0]))
+                self._remember(key, value)
+                self.disk_hits[name] += 1
+                return value
+
+        self.misses[name] += 1
+        value = compute()
+        self._remember(key, value)
+        if database is not None:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            with database:
+                database.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    (key, name, VERSIONS[name], sqlite3.Binary(data)))
+        return value
+
+    def convert(self, glyph, digest=None):
+        digest = digest or glyph_digest(glyph)
+        return self.lookup('convert', digest,
+                           lambda: Converter().run(glyph))
+
+    def hull(self, glyph, digest=None):
+        digest = digest or glyph_digest(glyph)
+        return self.lookup('hull', digest,
+                           lambda: GlyphConvexHull(glyph).points)
+
+    def circle(self, glyph, digest=None, seed=None):
+        digest = digest or glyph_digest(glyph)
+        return self.lookup('circle', digest, lambda: LinearEnclosingCircle(
+            self.hull(glyph, digest), seed=seed).circle)
+
+    def purge(self):
+        """Drop entries made by other versions of the computations."""
+        for key in [key for key in self._memory
+                        if int(key.split(':')[1]) !=
+                           VERSIONS.get(key.split(':')[0])]:
+            del self._memory[key]
+        database = self._database()
+        if database is None:
+            return
+        with database:
+            database.execute("DELETE FROM results WHERE name NOT IN (%s)" %
+                             ', '.join('?' * len(VERSIONS)), tuple(VERSIONS))
+            for name, version in VERSIONS.items():
+                database.execute("DELETE FROM results "
+                                 "WHERE name = ? AND version != ?",
+                                 (name, version))
+
+    def clear(self):
+        self._memory.clear()
+        database = self._database()
+        if database is not None:
+            with database:
+                database.execute("DELETE FROM results")
+
+    def stats(self):
+        """Return ``{name: (hits, disk hits, misses)}``."""
+        names = set(self.hits) | set(self.disk_hits) | set(self.misses)
+        return dict((name, (self.hits[name], self.disk_hits[name],
+                            self.misses[name]))
+                        for name in names)
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = self._pid = None
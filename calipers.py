@@ -0,0 +1,144 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+"""
+
+from structures import Point
+
+
+class Rectangle(object):
+    """Rectangle given by its corners in counterclockwise order."""
+
+    def __init__(self, corners, length, width):
+        self.corners = corners
+        self.length = length
+        self.width = width
+
+    @property
+    def area(self):
+        return self.length * self.width
+
+    @property
+    def perimeter(self):
+        return 2 * (self.length + self.width)
+
+    def __repr__(self):
+        return "<Rectangle: %r, %r x %r>" %\
+            (self.corners, self.length, self.width)
+
+
+class ShapeMetrics(object):
+    """Size features of a convex hull."""
+
+    def __init__(self, diameter, diameter_pair, width,
+                 min_area_rect, min_perimeter_rect):
+        self.diameter = diameter
+        self.diameter_pair = diameter_pair
+        self.width = width
+        self.min_area_rect = min_area_rect
+        self.min_perimeter_rect = min_perimeter_rect
+
+    def __repr__(self):
+        return ("<ShapeMetrics: diameter %r, width %r, "
+                "min area %r, min perimeter %r>" %
+                (self.diameter, self.width, self.min_area_rect.area,
+                 self.min_perimeter_rect.perimeter))
+
+
+class RotatingCalipers(object):
+    """
+    Compute ``ShapeMetrics`` of a convex polygon in one O(h) pass.
+
+    ``points`` must be the vertices of a convex hull in counterclockwise
+    order without collinear vertices, as produced by ``ConvexHull`` and
+    ``GlyphConvexHull``. For every hull edge three calipers are kept: the
+    vertex farthest from the edge line and the vertices with the largest
+    and the smallest projection on the edge direction. All of them only
+    move forward, so the whole pass is linear.
+
+    The minimum width, the minimum area and the minimum perimeter
+    rectangles all have a side flush with a hull edge, and every antipodal
+    pair is visited, which gives the diameter.
+    """
+
+    def __init__(self, points):
+        coords = [(float(point.x), float(point.y)) for point in points]
+        if not coords:
+            self.metrics = None
+        elif len(coords) == 1:
+            self.metrics = self.point_metrics(points[0])
+        else:
+            self.metrics = self.measure(coords)
+
+    def point_metrics(self, point):
+        rect = Rectangle([point] * 4, 0., 0.)
+        return ShapeMetrics(0., (point, point), 0., rect, rect)
+
+    def measure(self, coords):
+        n = len(coords)
+        best_pair, best_dist2 = (0, 0), -1.
+        width = None
+        area_rect = perimeter_rect = None
+        far = right = 1
+        left = None
+
+        for i in xrange(n):
+            ox, oy = coords[i]
+            ex, ey = coords[(i + 1) % n]
+            length = ((ex - ox) ** 2 + (ey - oy) ** 2) ** 0.5
+            if length == 0:
+                continue
+            ux, uy = (ex - ox) / length, (ey - oy) / length
+
+            def height(k):
+                x, y = coords[k % n]
+                return ux * (y - oy) - uy * (x - ox)
+
+            def shift(k):
+                x, y = coords[k % n]
+                return ux * (x - ox) + uy * (y - oy)
+
+            steps = 0
+            while steps < n and height(far + 1) > height(far):
+                far, steps = far + 1, steps + 1
+            for k in (far, far + 1):
+                for m in (i, i + 1):
+                    dist2 = self.dist2(coords[m % n], coords[k % n])
+                    if dist2 > best_dist2:
+                        best_pair, best_dist2 = (m % n, k % n), dist2
+
+            steps = 0
+            while steps < n and shift(right + 1) > shift(right):
+                right, steps = right + 1, steps + 1
+            if left is None:
+                left = far
+            steps = 0
+            while steps < n and shift(left + 1) < shift(left):
+                left, steps = left + 1, steps + 1
+
+            w = height(far)
+            tmin, tmax = shift(left), shift(right)
+            if width is None or w < width:
+                width = w
+            if area_rect is None or w * (tmax - tmin) < area_rect.area:
+                area_rect = self.rectangle(ox, oy, ux, uy, tmin, tmax, w)
+            if perimeter_rect is None or\
+                    2 * (w + tmax - tmin) < perimeter_rect.perimeter:
+                perimeter_rect = self.rectangle(ox, oy, ux, uy,
+                                                tmin, tmax, w)
+
+        first, second = best_pair
+        return ShapeMetrics(best_dist2 ** 0.5,
+                            (Point(*coords[first]), Point(*coords[second])),
+                            width, area_rect, perimeter_rect)
+
+    def dist2(self, p1, p2):
+        return (p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2
+
+    def rectangle(self, ox, oy, ux, uy, tmin, tmax, w):
+        # (-uy, ux) points inside of a counterclockwise polygon
+        nx, ny = -uy * w, ux * w
+        ax, ay = ox + ux * tmin, oy + uy * tmin
+        bx, by = ox + ux * tmax, oy + uy * tmax
+        return Rectangle([Point(ax, ay), Point(bx, by),
+                          Point(bx + nx, by + ny), Point(ax + nx, ay + ny)],
+                         tmax - tmin, w)
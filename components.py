@@ -0,0 +1,188 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Connected components and holes of run-encoded glyphs.
+
+Two runs of adjacent levels are connected when they overlap (4-connected
+pixels) or when they overlap or touch diagonally (8-connectivity). Runs
+being normalized, the runs of the previous level connected to a run form
+a contiguous range found by two binary searches, so all pairs come out
+of a few array operations and there are fewer of them than runs.
+Components are then merged by a vectorized union-find: every round hooks
+each root to the smallest root it is connected to and compresses the
+paths, so each round at least halves the number of roots.
+
+Holes are the components of the background, taken with the dual
+connectivity inside the bounding box grown by one pixel, except for the
+outer one. A hole belongs to the component owning the pixel right above
+its first pixel.
+"""
+
+import numpy
+
+import runs
+from settings import HORIZONTAL
+
+
+def adjacent_pairs(level, start, stop, connectivity=8):
+    """
+    Return index arrays ``(upper, lower)`` of connected runs, ``upper``
+    being on the previous level. Runs must be normalized.
+    """
+    if len(level) == 0:
+        return (numpy.zeros(0, dtype=runs.DTYPE),
+                numpy.zeros(0, dtype=runs.DTYPE))
+    touch = 1 if connectivity == 8 else 0
+    # keys order runs by (level, position) with positions made positive
+    base = start.min() - touch - 1
+    span = stop.max() - base + touch + 1
+    start_key = level * span + (start - base)
+    stop_key = level * span + (stop - base)
+    previous = (level - 1) * span
+    first = numpy.searchsorted(stop_key, previous + start - base - touch,
+                               side='right')
+    last = numpy.searchsorted(start_key, previous + stop - base + touch,
+                              side='left')
+    count = numpy.maximum(last - first, 0)
+    lower = numpy.repeat(numpy.arange(len(level)), count)
+    offsets = numpy.arange(count.sum()) - numpy.repeat(count.cumsum() - count,
+                                                       count)
+    upper = first[lower] + offsets
+    return upper, lower
+
+
+def label_runs(level, start, stop, connectivity=8):
+    """
+    Return the component of every normalized run, numbered from 0 in the
+    order of the first run of each component.
+    """
+    parent = numpy.arange(len(level))
+    upper, lower = adjacent_pairs(level, start, stop, connectivity)
+    while True:
+        first, second = parent[upper], parent[lower]
+        differ = first != second
+        if not differ.any():
+            break
+        low = numpy.minimum(first, second)[differ]
+        high = numpy.maximum(first, second)[differ]
+        numpy.minimum.at(parent, high, low)
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+    # roots are the first runs of their components
+    roots, labels = numpy.unique(parent, return_inverse=True)
+    return labels
+
+
+class Component(object):
+    """One connected component of a glyph."""
+
+    def __init__(self, glyph, pixels, bbox, holes):
+        self.glyph = glyph
+        self.pixels = pixels
+        self.bbox = bbox
+        self.holes = holes
+
+    def __repr__(self):
+        return "<Component: %i runs, %i pixels, bbox %r, %i holes>" %\
+            (len(self.glyph), self.pixels, self.bbox, self.holes)
+
+
+class ConnectedComponents(object):
+    """
+    Split a glyph into connected components.
+
+    Components are numbered in the order of their first runs. Their
+    statistics are kept in arrays: ``pixels``, ``bboxes`` with rows of
+    inclusive ``(x0, y0, x1, y1)`` and ``hole_counts``. Indexing or
+    iterating gives ``Component`` objects with their own glyphs, built on
+    demand, so a page of many tiny components is cheap to split.
+    ``labels`` gives the component of every normalized run of the glyph,
+    ``holes`` is the total number of holes and ``euler_number`` the
+    number of components minus the number of holes.
+    """
+
+    def __init__(self, glyph, connectivity=8):
+        if connectivity not in (4, 8):
+            raise ValueError("Connectivity must be 4 or 8, not %r" %
+                             (connectivity, ))
+        self.orientation = glyph.orientation
+        self.connectivity = connectivity
+        level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+        self.labels = label_runs(level, start, stop, connectivity)
+        count = self.labels.max() + 1 if len(level) else 0
+
+        self.hole_counts = self.count_holes(level, start, stop, count)
+        self.holes = int(self.hole_counts.sum())
+        self.euler_number = count - self.holes
+
+        order = numpy.argsort(self.labels, kind='mergesort')
+        self._runs = level[order], start[order], stop[order]
+        heads = numpy.flatnonzero(numpy.diff(self.labels[order])) + 1
+        self._bounds = numpy.concatenate([[0], heads, [len(level)]])
+        if not count:
+            self.pixels = numpy.zeros(0, dtype=runs.DTYPE)
+            self.bboxes = numpy.zeros((0, 4), dtype=runs.DTYPE)
+            return
+        level, start, stop = self._runs
+        first = self._bounds[:-1]
+        self.pixels = numpy.add.reduceat(stop - start, first)
+        level_min = numpy.minimum.reduceat(level, first)
+        level_max = numpy.maximum.reduceat(level, first)
+        start_min = numpy.minimum.reduceat(start, first)
+        stop_max = numpy.maximum.reduceat(stop, first) - 1
+        if glyph.orientation == HORIZONTAL:
+            columns = (start_min, level_min, stop_max, level_max)
+        else:
+            columns = (level_min, start_min, level_max, stop_max)
+        self.bboxes = numpy.column_stack(columns)
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("component index out of range")
+        first, last = self._bounds[index], self._bounds[index + 1]
+        level, start, stop = self._runs
+        glyph = runs.to_glyph(self.orientation, level[first:last],
+                              start[first:last], stop[first:last])
+        return Component(glyph, int(self.pixels[index]),
+                         tuple(self.bboxes[index].tolist()),
+                         int(self.hole_counts[index]))
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    @property
+    def components(self):
+        return list(self)
+
+    def count_holes(self, level, start, stop, count):
+        """Return the number of holes of every component."""
+        if not count:
+            return numpy.zeros(0, dtype=numpy.int64)
+        frame_levels = numpy.arange(level.min() - 1, level.max() + 2)
+        frame = (frame_levels,
+                 numpy.repeat(start.min() - 1, len(frame_levels)),
+                 numpy.repeat(stop.max() + 1, len(frame_levels)))
+        background = runs.combine(frame, (level, start, stop),
+                                  runs.and_not)
+        dual = 4 if self.connectivity == 8 else 8
+        labels = label_runs(background[0], background[1], background[2],
+                            dual)
+        # the first background run is the top of the frame, so label 0 is
+        # the outer background; the others start at their first runs
+        heads = numpy.unique(labels, return_index=True)[1][1:]
+        # find the run holding the pixel right above every hole
+        span = stop.max() - start.min() + 3
+        key = level * span + (start - start.min())
+        above = ((background[0][heads] - 1) * span +
+                 (background[1][heads] - start.min()))
+        owner_runs = numpy.searchsorted(key, above, side='right') - 1
+        return numpy.bincount(self.labels[owner_runs], minlength=count)
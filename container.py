@@ -0,0 +1,279 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Compact binary container for glyph corpora.
+
+Layout (all numbers little-endian)::
+
+    header   'GLYC', u16 version, u8 orientation, u8 reserved
+    glyph*   u16 encoding length, encoding, u8 orientation,
+             4 x i32 bbox, 3 x f64 circle (x, y, r),
+             u32 number of runs, u32 payload length, payload
+    footer   u64 offset of every glyph,
+             u64 number of glyphs, u64 offset of the footer, 'GLYC'
+
+The payload holds three varints per run: zigzag-encoded deltas of ``x``
+and ``y`` against the previous run and the plain length ``l``. Since
+corpus runs go row by row, the deltas are mostly tiny and one byte per
+value is typical. Varints are encoded and decoded with NumPy for all
+runs of a glyph at once.
+
+``PackedCorpus`` memory-maps a file and reads the footer table and run
+payloads as views of the map, so opening a file is O(1) and any glyph can
+be fetched without touching the others. Version 1 files have no
+orientation per glyph; the one of the header applies to all of them.
+
+Usage (convert a text corpus):
+
+  ``$ python container.py input/glyphs.txt glyphs.glyc``
+"""
+
+import argparse
+import mmap
+import struct
+
+import numpy
+
+import instrument
+import reader
+import structures
+from settings import HORIZONTAL, VERTICAL
+
+MAGIC = 'GLYC'
+VERSION = 2
+
+_HEADER = struct.Struct('<4sHBB')
+_ENCODING = struct.Struct('<H')
+_ORIENTATION = struct.Struct('<B')
+_RECORD = struct.Struct('<4i3dII')
+_TRAILER = struct.Struct('<QQ4s')
+
+
+class ImproperContainer(Exception):
+    pass
+
+
+def encode_varints(values):
+    """Encode non-negative integers as LEB128 varints."""
+    values = numpy.asarray(values, dtype=numpy.uint64)
+    sizes = numpy.ones(len(values), dtype=numpy.int64)
+    for shift in xrange(7, 64, 7):
+        sizes += values >= (numpy.uint64(1) << numpy.uint64(shift))
+    owner = numpy.repeat(numpy.arange(len(values)), sizes)
+    position = (numpy.arange(sizes.sum()) -
+                numpy.repeat(numpy.cumsum(sizes) - sizes, sizes))
+    shifts = numpy.uint64(7) * position.astype(numpy.uint64)
+    data = ((values[owner] >> shifts) & numpy.uint64(0x7f)).astype(numpy.uint8)
+    data[position < sizes[owner] - 1] |= 0x80
+    return data
+
+
+def decode_varints(data, count):
+    """Decode ``count`` varints from the beginning of a uint8 array."""
+    if count == 0:
+        return numpy.zeros(0, dtype=numpy.uint64)
+    if len(data) == count:
+        # every value fits into a single byte
+        return data.astype(numpy.uint64)
+    ends = numpy.flatnonzero(data < 0x80)[:count]
+    if len(ends) < count:
+        raise ImproperContainer("Run payload is truncated")
+    starts = numpy.empty(count, dtype=numpy.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    sizes = ends - starts + 1
+    position = (numpy.arange(ends[-1] + 1) -
+                numpy.repeat(starts, sizes)).astype(numpy.uint64)
+    parts = ((data[:ends[-1] + 1] & 0x7f).astype(numpy.uint64) <<
+             (numpy.uint64(7) * position))
+    return numpy.bitwise_or.reduceat(parts, starts)
+
+
+def zigzag(values):
+    values = numpy.asarray(values, dtype=numpy.int64)
+    return ((values << 1) ^ (values >> 63)).astype(numpy.uint64)
+
+
+def unzigzag(values):
+    values = numpy.asarray(values, dtype=numpy.uint64)
+    return ((values >> numpy.uint64(1)).astype(numpy.int64) ^
+            -(values & numpy.uint64(1)).astype(numpy.int64))
+
+
+def encode_runs(glyph):
+    x = glyph.x.astype(numpy.int64)
+    y = glyph.y.astype(numpy.int64)
+    values = numpy.empty((len(x), 3), dtype=numpy.uint64)
+    values[:, 0] = zigzag(numpy.concatenate([x[:1], numpy.diff(x)]))
+    values[:, 1] = zigzag(numpy.concatenate([y[:1], numpy.diff(y)]))
+    values[:, 2] = glyph.l
+    return encode_varints(values.ravel())
+
+
+def decode_runs(payload, count, orientation):
+    values = decode_varints(payload, 3 * count).reshape(-1, 3)
+    x = numpy.cumsum(unzigzag(values[:, 0]))
+    y = numpy.cumsum(unzigzag(values[:, 1]))
+    return structures.Glyph.from_arrays(orientation, x, y, values[:, 2])
+
+
+class PackedWriter(object):
+    """Stream glyph records into a container file."""
+
+    def __init__(self, path, orientation=VERTICAL):
+        self._file = open(path, 'wb')
+        self._offsets = []
+        self._file.write(_HEADER.pack(MAGIC, VERSION, int(orientation), 0))
+
+    def write(self, record):
+        self._offsets.append(self._file.tell())
+        payload = encode_runs(record.glyph)
+        circle = record.circle
+        self._file.write(_ENCODING.pack(len(record.encoding)))
+        self._file.write(record.encoding)
+        self._file.write(_ORIENTATION.pack(int(record.glyph.orientation)))
+        self._file.write(_RECORD.pack(*(tuple(record.bbox) +
+                                        (circle.x, circle.y, circle.r,
+                                         len(record.glyph), len(payload)))))
+        self._file.write(payload.tostring())
+
+    def close(self):
+        footer = self._file.tell()
+        numpy.array(self._offsets, dtype='<u8').tofile(self._file)
+        self._file.write(_TRAILER.pack(len(self._offsets), footer, MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PackedCorpus(object):
+    """
+    Random-access reader of container files with the interface of
+    ``reader.Corpus``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ImproperContainer("%s is empty" % (path, ))
+        try:
+            self._open()
+        except Exception:
+            self._data = self._offsets = None
+            self._map.close()
+            self._file.close()
+            raise
+
+    def _open(self):
+        size = len(self._map)
+        if size < _HEADER.size + _TRAILER.size:
+            raise ImproperContainer("%s is too short" % (self.path, ))
+        magic, version, orientation, _ = _HEADER.unpack_from(self._map, 0)
+        count, footer, tail = _TRAILER.unpack_from(self._map,
+                                                   size - _TRAILER.size)
+        if magic != MAGIC or tail != MAGIC:
+            raise ImproperContainer("%s is not a glyph container" %
+                                    (self.path, ))
+        if version not in (1, VERSION):
+            raise ImproperContainer("Unsupported container version %i" %
+                                    (version, ))
+        if footer + 8 * count > size - _TRAILER.size:
+            raise ImproperContainer("%s has a truncated glyph table" %
+                                    (self.path, ))
+        self.orientation = bool(orientation)
+        self.version = version
+        self._data = numpy.frombuffer(self._map, dtype=numpy.uint8)
+        self._offsets = numpy.frombuffer(self._map, dtype='<u8',
+                                         count=count, offset=footer)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("corpus index out of range")
+        return self._read(index)
+
+    @instrument.timed('parse')
+    def _read(self, index):
+        offset = int(self._offsets[index])
+        length, = _ENCODING.unpack_from(self._map, offset)
+        offset += _ENCODING.size
+        encoding = self._map[offset:offset + length]
+        offset += length
+        orientation = self.orientation
+        if self.version > 1:
+            orientation = bool(_ORIENTATION.unpack_from(self._map, offset)[0])
+            offset += _ORIENTATION.size
+        fields = _RECORD.unpack_from(self._map, offset)
+        offset += _RECORD.size
+        count, size = fields[7:]
+        glyph = decode_runs(self._data[offset:offset + size], count,
+                            orientation)
+        return structures.GlyphRecord(encoding, fields[:4],
+                                      structures.Circle(*fields[4:7]), glyph)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def close(self):
+        # views have to be released before the map can be closed
+        self._data = self._offsets = None
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_corpus(path, orientation=VERTICAL):
+    """
+    Open a container file or a text corpus, whichever ``path`` is.
+
+    ``orientation`` only applies to rows of text corpora without an
+    orientation flag, containers store it.
+    """
+    with open(path, 'rb') as probe:
+        if probe.read(len(MAGIC)) == MAGIC:
+            return PackedCorpus(path)
+    return reader.Corpus(path, orientation)
+
+
+def convert(text_path, packed_path, orientation=VERTICAL):
+    """Convert a text corpus into a container file."""
+    with reader.Corpus(text_path, orientation) as corpus:
+        with PackedWriter(packed_path, orientation) as writer:
+            for record in corpus:
+                writer.write(record)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert a text glyph corpus into a binary container.")
+    parser.add_argument('corpus')
+    parser.add_argument('output')
+    parser.add_argument('--horizontal', action='store_true',
+                        help="rows without an orientation flag "
+                             "are horizontal")
+    args = parser.parse_args(argv)
+    convert(args.corpus, args.output,
+            HORIZONTAL if args.horizontal else VERTICAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Distances between glyphs: Hausdorff and chamfer.
+
+Both come from exact Euclidean distance transforms. A glyph is laid on
+a grid covering both glyphs with its runs as seeds; the first pass
+finds, along every grid row, the distance to the nearest set pixel of
+that row with running maxima and minima of pixel indices. The second
+pass is the lower envelope of parabolas of Felzenszwalb and
+Huttenlocher, run for all grid columns in lockstep, so both passes are
+linear in the grid size and loop in Python only along the shorter side
+of the grid. Small grids skip the loop and compare all rows at once.
+
+Distances from the pixels of one glyph to the other are read from the
+other's transform: their maximum is the directed Hausdorff distance and
+their mean the directed chamfer distance. Symmetric distances take the
+larger, respectively the mean, of both directions.
+
+Matching against a threshold first tries cheap lower bounds of the
+Hausdorff distance: the bounding boxes, the radii of the minimum
+enclosing circles and support functions of the convex hulls in a few
+directions. Candidates failing a bound never get a transform.
+"""
+
+import math
+
+import numpy
+
+from algorithm import GlyphConvexHull, LinearEnclosingCircle
+from settings import HORIZONTAL
+
+DIRECTIONS = 16
+# up to this many (row, row, column) triples the envelope pass compares
+# all rows at once, which beats the loop for glyphs of usual sizes
+DENSE_CELLS = 1 << 20
+_angles = numpy.arange(DIRECTIONS) * (2 * math.pi / DIRECTIONS)
+_UNITS = numpy.column_stack([numpy.cos(_angles), numpy.sin(_angles)])
+
+
+def bounding_box(glyph):
+    """Return inclusive ``(x0, y0, x1, y1)`` of a non-empty glyph."""
+    x, y, l = glyph.x, glyph.y, glyph.l
+    if glyph.orientation == HORIZONTAL:
+        return x.min(), y.min(), (x + l).max() - 1, y.max()
+    return x.min(), y.min(), x.max(), (y + l).max() - 1
+
+
+def mask(glyph, x0, y0, width, height):
+    """Return a boolean ``(height, width)`` grid of the glyph pixels."""
+    diff = numpy.zeros((height + 1, width + 1), dtype=numpy.int32)
+    x, y, l = glyph.x - x0, glyph.y - y0, glyph.l
+    numpy.add.at(diff, (y, x), 1)
+    if glyph.orientation == HORIZONTAL:
+        numpy.add.at(diff, (y, x + l), -1)
+        covered = diff.cumsum(axis=1)
+    else:
+        numpy.add.at(diff, (y + l, x), -1)
+        covered = diff.cumsum(axis=0)
+    return covered[:-1, :-1] > 0
+
+
+def _row_pass(pixels):
+    """Squared distances to the nearest set pixel of the same row."""
+    width = pixels.shape[1]
+    far = 2 * width + 1
+    index = numpy.arange(width)
+    left = numpy.maximum.accumulate(numpy.where(pixels, index, -far),
+                                    axis=1)
+    right = numpy.minimum.accumulate(
+        numpy.where(pixels, index, far)[:, ::-1], axis=1)[:, ::-1]
+    gap = numpy.minimum(index - left, right - index).astype(float)
+    gap[gap > width] = numpy.inf
+    return gap * gap
+
+
+def _envelope(f):
+    """
+    Return ``min(f[r'] + (r - r') ** 2 over r')`` for every row ``r``,
+    each column of ``f`` on its own.
+    """
+    rows, columns = f.shape
+    if rows * rows * columns <= DENSE_CELLS:
+        row = numpy.arange(rows)
+        square = (row[:, None] - row[None, :]) ** 2
+        return (square[:, :, None] + f[None, :, :]).min(axis=1)
+    column = numpy.arange(columns)
+    vertex = numpy.zeros((rows, columns), dtype=numpy.int64)
+    bound = numpy.empty((rows + 1, columns))
+    bound[0] = -numpy.inf
+    bound[1] = numpy.inf
+    top = numpy.repeat(-1, columns)
+
+    def intersection(q, which):
+        p = vertex[top[which], column[which]]
+        return (((f[q, which] + q * q) - (f[p, which] + p * p)) /
+                (2. * (q - p)))
+
+    for q in xrange(rows):
+        finite = numpy.isfinite(f[q])
+        first = finite & (top < 0)
+        top[first] = 0
+        vertex[0, first] = q
+        rest = numpy.flatnonzero(finite & ~first)
+        if not len(rest):
+            continue
+        crossing = intersection(q, rest)
+        while True:
+            # drop parabolas hidden by the new one
+            hidden = crossing <= bound[top[rest], rest]
+            if not hidden.any():
+                break
+            top[rest[hidden]] -= 1
+            crossing[hidden] = intersection(q, rest[hidden])
+        top[rest] += 1
+        vertex[top[rest], rest] = q
+        bound[top[rest], rest] = crossing
+        bound[top[rest] + 1, rest] = numpy.inf
+
+    result = numpy.empty((rows, columns))
+    result.fill(numpy.inf)
+    present = numpy.flatnonzero(top >= 0)
+    current = numpy.zeros(len(present), dtype=numpy.int64)
+    for q in xrange(rows):
+        while True:
+            behind = bound[current + 1, present] < q
+            if not behind.any():
+                break
+            current[behind] += 1
+        p = vertex[current, present]
+        result[q, present] = (q - p) ** 2 + f[p, present]
+    return result
+
+
+def distance_transform(pixels):
+    """
+    Return squared Euclidean distances from every cell of a boolean grid
+    to its nearest set cell (infinite if there is none).
+    """
+    if pixels.shape[0] > pixels.shape[1]:
+        # the envelope pass loops over rows, keep them few
+        return distance_transform(pixels.T).T
+    return _envelope(_row_pass(pixels))
+
+
+class Shape(object):
+    """Data of a glyph reused by every comparison it takes part in."""
+
+    def __init__(self, glyph):
+        self.glyph = glyph
+        self.empty = not len(glyph)
+        if self.empty:
+            return
+        self.bbox = numpy.array(bounding_box(glyph))
+        hull = GlyphConvexHull(glyph).points
+        self.radius = LinearEnclosingCircle(hull, seed=0).circle.r
+        vertices = numpy.array([(point.x, point.y) for point in hull],
+                               dtype=float)
+        self.support = vertices.dot(_UNITS.T).max(axis=0)
+
+
+def _shape(glyph):
+    return glyph if isinstance(glyph, Shape) else Shape(glyph)
+
+
+def lower_bound(first, second):
+    """Return a lower bound of the Hausdorff distance of two shapes."""
+    first, second = _shape(first), _shape(second)
+    if first.empty or second.empty:
+        return 0. if first.empty == second.empty else numpy.inf
+    # every edge of one bounding box needs a pixel of the other glyph
+    return max(numpy.abs(first.bbox - second.bbox).max(),
+               abs(first.radius - second.radius),
+               numpy.abs(first.support - second.support).max())
+
+
+def directed(first, second):
+    """
+    Return the directed ``(hausdorff, chamfer)`` distances of two
+    non-empty glyphs both ways: from the pixels of ``first`` to
+    ``second`` and back.
+    """
+    a, b = bounding_box(first), bounding_box(second)
+    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+    width = max(a[2], b[2]) - x0 + 1
+    height = max(a[3], b[3]) - y0 + 1
+    first_pixels = mask(first, x0, y0, width, height)
+    second_pixels = mask(second, x0, y0, width, height)
+    to_second = numpy.sqrt(distance_transform(second_pixels)[first_pixels])
+    to_first = numpy.sqrt(distance_transform(first_pixels)[second_pixels])
+    return ((to_second.max(), to_second.mean()),
+            (to_first.max(), to_first.mean()))
+
+
+def compare(first, second):
+    """
+    Return the symmetric ``(hausdorff, chamfer)`` distances of two
+    glyphs or shapes; the chamfer distance is the mean of both directed
+    mean distances.
+    """
+    first, second = _shape(first), _shape(second)
+    if first.empty or second.empty:
+        same = first.empty and second.empty
+        return (0., 0.) if same else (numpy.inf, numpy.inf)
+    forth, back = directed(first.glyph, second.glyph)
+    return max(forth[0], back[0]), (forth[1] + back[1]) / 2.
+
+
+def one_to_many(template, candidates, max_hausdorff=None):
+    """
+    Compare a template with many glyphs or shapes.
+
+    Return a list with ``(hausdorff, chamfer)`` for every candidate, or
+    None for candidates whose Hausdorff distance is known to exceed
+    ``max_hausdorff`` without computing it.
+    """
+    template = _shape(template)
+    shapes = [_shape(candidate) for candidate in candidates]
+    results = []
+    for shape in shapes:
+        if max_hausdorff is not None and\
+                lower_bound(template, shape) > max_hausdorff:
+            results.append(None)
+            continue
+        distances = compare(template, shape)
+        if max_hausdorff is not None and distances[0] > max_hausdorff:
+            results.append(None)
+        else:
+            results.append(distances)
+    return results
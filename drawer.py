@@ -6,15 +6,30 @@ from OpenGL.GLUT import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+import sys
+import time
+
 from gelements import GDrawing, GZone, GLine, GPoint, GCircle
 from settings import WIDTH, HEIGHT, SCALE, HORIZONTAL, VERTICAL
 
 
 class MainWindow(object):
-    def __init__(self, drawing):
+    """
+    GLUT window showing a drawing.
+
+    Arrow keys pan the view, ``+``/``-`` zoom, Page Up/Page Down flip
+    through pages of the layout and Home returns to the first page.
+
+    With ``measure_frames`` set, the window redraws continuously and
+    prints frame time statistics every ``measure_frames`` frames.
+    """
+
+    def __init__(self, drawing, measure_frames=0):
         self.width, self.height = WIDTH, HEIGHT
         self.caption = "Glyph manipulations"
         self.drawing = drawing
+        self.measure_frames = measure_frames
+        self.frame_times = []
         self._init_glut()
         self._init_gl()
         glutMainLoop()
@@ -31,16 +46,66 @@ class MainWindow(object):
         glutInitDisplayMode(GLUT_RGB | GLUT_SINGLE)
         glutCreateWindow(self.caption)
         glutDisplayFunc(self.on_draw)
+        glutKeyboardFunc(self.on_key)
+        glutSpecialFunc(self.on_special_key)
+        if self.measure_frames:
+            glutIdleFunc(glutPostRedisplay)
 
     def on_draw(self):
+        started = time.time()
         glClear(GL_COLOR_BUFFER_BIT)
         if self.drawing:
            self.drawing.draw()
         glFlush()
+        if self.measure_frames:
+            # wait for the GPU, otherwise only command submission is timed
+            glFinish()
+            self._record_frame(time.time() - started)
+
+    def on_key(self, key, x, y):
+        if key in '+=':
+            self.drawing.zoom_by(1.25)
+        elif key in '-_':
+            self.drawing.zoom_by(0.8)
+        else:
+            return
+        glutPostRedisplay()
+
+    def on_special_key(self, key, x, y):
+        step = self.height / 10
+        drawing = self.drawing
+        if key == GLUT_KEY_LEFT:
+            drawing.pan(-step, 0)
+        elif key == GLUT_KEY_RIGHT:
+            drawing.pan(step, 0)
+        elif key == GLUT_KEY_UP:
+            drawing.pan(0, step)
+        elif key == GLUT_KEY_DOWN:
+            drawing.pan(0, -step)
+        elif key == GLUT_KEY_PAGE_UP:
+            drawing.show_page(drawing.page + 1)
+        elif key == GLUT_KEY_PAGE_DOWN:
+            drawing.show_page(drawing.page - 1)
+        elif key == GLUT_KEY_HOME:
+            drawing.show_page(0)
+        else:
+            return
+        glutPostRedisplay()
+
+    def _record_frame(self, elapsed):
+        self.frame_times.append(elapsed)
+        if len(self.frame_times) < self.measure_frames:
+            return
+        times = sorted(self.frame_times)
+        print 'Frame time over %i frames: mean %.2f ms, ' \
+              'median %.2f ms, max %.2f ms' % (
+                len(times), 1000. * sum(times) / len(times),
+                1000. * times[len(times) / 2], 1000. * times[-1])
+        self.frame_times = []
 
 
-def run_gui(drawing):
-    window = MainWindow(drawing)
+def run_gui(drawing, measure_frames=0):
+    window = MainWindow(drawing, measure_frames)
 
 
 if __name__ == "__main__":
@@ -53,4 +118,4 @@ if __name__ == "__main__":
                            GLine(4, 0, 5, HORIZONTAL)]))
     drawing.add_zone(GZone(elements=[GCircle(10, 10, 6)]))
 
-    run_gui(drawing)
+    run_gui(drawing, measure_frames=100 if '--measure' in sys.argv else 0)
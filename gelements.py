@@ -2,44 +2,105 @@
 Authors: Nastia Merlits, Kostia Balitsky
 """
 
-from OpenGL.GLUT import *
-from OpenGL.GL import *
-from OpenGL.GLU import *
+import bisect
+import math
+from math import pi
 
-from math import pi, cos, sin
+import numpy
+
+import instrument
 import structures
 from settings import (BORDER_COLOR, FILL_COLOR, HORIZONTAL, VERTICAL,
                         XOFFSET, YOFFSET, SCALE)
 
+# Unit circle outline as GL_LINES vertex pairs, computed once for all
+# circles instead of calling cos/sin for every vertex on every frame.
+_CIRCLE_STEPS = 2000
+_angles = pi - numpy.arange(_CIRCLE_STEPS + 1) * (2 * pi / _CIRCLE_STEPS)
+_ring = numpy.column_stack([numpy.cos(_angles), numpy.sin(_angles)])
+UNIT_CIRCLE = numpy.column_stack([_ring[:-1], _ring[1:]]).reshape(-1, 2)
+
+
+def _opengl():
+    """
+    Return ``OpenGL.GL``, imported on the first draw: drawings are also
+    built and rasterized offscreen by ``raster``, which must not pay for
+    the import or need PyOpenGL at all.
+    """
+    from OpenGL import GL
+    return GL
+
+
+def _concat(chunks):
+    """Join vertex lists and arrays into one float32 array of (x, y)."""
+    chunks = [numpy.asarray(chunk, dtype=numpy.float32).reshape(-1, 2)
+                for chunk in chunks if len(chunk)]
+    if not chunks:
+        return numpy.zeros((0, 2), dtype=numpy.float32)
+    return numpy.concatenate(chunks)
+
+
+def _rect_fill(left, top, right, bottom):
+    return [(left, top), (right, top), (right, bottom), (left, bottom)]
+
+
+def _rect_border(left, top, right, bottom):
+    return [(left, top), (right, top), (right, top), (right, bottom),
+            (right, bottom), (left, bottom), (left, bottom), (left, top)]
+
+
 class GElement(object):
+    """
+    Base drawing element.
+
+    Elements describe their geometry as vertex lists: ``fill_quads`` for
+    GL_QUADS drawn with ``FILL_COLOR`` and ``border_lines`` for GL_LINES
+    drawn with ``BORDER_COLOR``. Zones batch these into vertex buffers.
+    """
+
+    def fill_quads(self, x, y, scale):
+        return []
+
+    def border_lines(self, x, y, scale):
+        return []
+
     def draw(self, x, y, scale):
-        return NotImplemented
+        GL = _opengl()
+        GL.glColor3f(*FILL_COLOR)
+        GL.glBegin(GL.GL_QUADS)
+        for vertex in self.fill_quads(x, y, scale):
+            GL.glVertex2f(*vertex)
+        GL.glEnd()
+        GL.glColor3f(*BORDER_COLOR)
+        GL.glBegin(GL.GL_LINES)
+        for vertex in self.border_lines(x, y, scale):
+            GL.glVertex2f(*vertex)
+        GL.glEnd()
+
 
-class GPoint(object):
+class GPoint(GElement):
     def __init__(self, x, y):
         self.x = x
         self.y = y
 
-    def draw(self, x, y, scale):
+    def _bounds(self, x, y, scale):
         left = x + self.x * scale
-        right = left + scale - 1
         top = y + self.y * scale
-        bottom = top + scale - 1
+        return left, top, left + scale - 1, top + scale - 1
+
+    def fill_quads(self, x, y, scale):
+        return _rect_fill(*self._bounds(x, y, scale))
 
-        glColor3f(*FILL_COLOR)
-        glBegin(GL_POLYGON)
-        glVertex2i(left, top)
-        glVertex2i(right, top)
-        glVertex2i(right, bottom)
-        glVertex2i(left, bottom)
-        glEnd()
-        glColor3f(*BORDER_COLOR)
-        glBegin(GL_LINE_LOOP)
-        glVertex2i(left, top)
-        glVertex2i(right, top)
-        glVertex2i(right, bottom)
-        glVertex2i(left, bottom)
-        glEnd()
+    def border_lines(self, x, y, scale):
+        return _rect_border(*self._bounds(x, y, scale))
+
+    @property
+    def min_x(self):
+        return self.x
+
+    @property
+    def min_y(self):
+        return self.y
 
     @property
     def max_x(self):
@@ -57,6 +118,14 @@ class GLine(GElement):
         self.l = l
         self.orientation = orientation
 
+    @property
+    def min_x(self):
+        return self.x
+
+    @property
+    def min_y(self):
+        return self.y
+
     @property
     def max_x(self):
         if self.orientation == HORIZONTAL:
@@ -69,7 +138,7 @@ class GLine(GElement):
             return self.y + self.l - 1
         return self.y
 
-    def draw(self, x, y, scale):
+    def _bounds(self, x, y, scale):
         left = x + self.x * scale
         right = left + scale - 1
         top = y + self.y * scale
@@ -79,22 +148,13 @@ class GLine(GElement):
             right = right + scale * (self.l - 1)
         else:
             bottom = bottom + scale * (self.l - 1)
-        
-        glColor3f(*FILL_COLOR)
-        glBegin(GL_POLYGON)
-        glVertex2i(left, top)
-        glVertex2i(right, top)
-        glVertex2i(right, bottom)
-        glVertex2i(left, bottom)
-        glEnd()
-        glColor3f(*BORDER_COLOR)
-        glBegin(GL_LINE_LOOP)
-        glVertex2i(left, top)
-        glVertex2i(right, top)
-        glVertex2i(right, bottom)
-        glVertex2i(left, bottom)
-        glEnd()
+        return left, top, right, bottom
 
+    def fill_quads(self, x, y, scale):
+        return _rect_fill(*self._bounds(x, y, scale))
+
+    def border_lines(self, x, y, scale):
+        return _rect_border(*self._bounds(x, y, scale))
 
 
 class GCircle(GElement):
@@ -103,6 +163,14 @@ class GCircle(GElement):
         self.y = y
         self.r = r
 
+    @property
+    def min_x(self):
+        return self.x - self.r
+
+    @property
+    def min_y(self):
+        return self.y - self.r
+
     @property
     def max_x(self):
         return max(self.x + self.r - 1, 2 * self.r)
@@ -111,41 +179,149 @@ class GCircle(GElement):
     def max_y(self):
         return max(self.y + self.r - 1, 2 * self.r)
 
-    def draw(self, x, y, scale):
+    def border_lines(self, x, y, scale):
         cx, cy = x + self.x * scale + scale/2, y + self.y * scale + scale/2
-        step = pi / 1000
-        rad = self.r * scale
-        glColor3f(*BORDER_COLOR)
-        glBegin(GL_LINE_LOOP)
-        angle = pi
-        while angle > -pi:
-            glVertex2i(int(cx + cos(angle) * rad),
-                       int(cy + sin(angle) * rad))
-            angle = angle - step
-        glEnd()
+        return UNIT_CIRCLE * (self.r * scale) + (cx, cy)
+
+
+class ZoneBuffers(object):
+    """
+    Vertex buffers with the geometry of all elements of a zone, built in
+    zone coordinates for one scale and drawn with two glDrawArrays calls.
+    """
+
+    def __init__(self, elements, scale):
+        self.scale = scale
+        self.fill = _concat([el.fill_quads(0, 0, scale) for el in elements])
+        self.border = _concat([el.border_lines(0, 0, scale)
+                                for el in elements])
+        self._vbos = None
+
+    def _draw_array(self, buf, count, mode, color):
+        if not count:
+            return
+        GL = _opengl()
+        GL.glColor3f(*color)
+        buf.bind()
+        try:
+            GL.glVertexPointer(2, GL.GL_FLOAT, 0, buf)
+            GL.glDrawArrays(mode, 0, count)
+        finally:
+            buf.unbind()
+
+    def draw(self, x, y):
+        GL = _opengl()
+        if self._vbos is None:
+            # uploading needs a current GL context, so do it on first draw
+            from OpenGL.arrays import vbo
+            self._vbos = (vbo.VBO(self.fill), vbo.VBO(self.border))
+        fill, border = self._vbos
+        GL.glPushMatrix()
+        GL.glTranslatef(x, y, 0)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        try:
+            self._draw_array(fill, len(self.fill), GL.GL_QUADS, FILL_COLOR)
+            self._draw_array(border, len(self.border), GL.GL_LINES,
+                             BORDER_COLOR)
+        finally:
+            GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+            GL.glPopMatrix()
 
 
 class GZone(GElement):
-    def __init__(self, elements=[]):
-        self.elements = elements
+    def __init__(self, elements=None):
+        self.elements = list(elements) if elements else []
+        self.drawing = None
+        self._buffers = None
+        self._extent = None
 
     def add_element(self, element):
-        self.element.append(element)
+        self.elements.append(element)
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop cached buffers and sizes after elements have been changed."""
+        self._buffers = None
+        self._extent = None
+        if self.drawing is not None:
+            self.drawing.invalidate_layout()
+
+    def buffers(self, scale):
+        if self._buffers is None or self._buffers.scale != scale:
+            self._buffers = ZoneBuffers(self.elements, scale)
+        return self._buffers
+
+    def fill_quads(self, x, y, scale):
+        return _concat([el.fill_quads(x, y, scale) for el in self.elements])
+
+    def border_lines(self, x, y, scale):
+        return _concat([el.border_lines(x, y, scale)
+                            for el in self.elements])
 
     def draw(self, x, y, scale):
-        for element in self.elements:
-            element.draw(x, y, scale)
+        self.buffers(scale).draw(x, y)
+
+    @property
+    def extent(self):
+        """(min_x, min_y, max_x, max_y) of all elements, cached."""
+        if self._extent is None:
+            self._extent = (min([el.min_x for el in self.elements]),
+                            min([el.min_y for el in self.elements]),
+                            max([el.max_x for el in self.elements]),
+                            max([el.max_y for el in self.elements]))
+        return self._extent
+
+    @property
+    def min_x(self):
+        return self.extent[0]
+
+    @property
+    def min_y(self):
+        return self.extent[1]
+
+    @property
+    def max_x(self):
+        return self.extent[2]
+
+    @property
+    def max_y(self):
+        return self.extent[3]
 
     @property
     def width(self):
-        return max([el.max_x for el in self.elements])
+        return self.max_x
 
     @property
     def height(self):
-        return max([el.max_y for el in self.elements])
+        return self.max_y
+
+
+class Shelf(object):
+    """
+    One row of the flow layout: positions of its zones in left to right
+    order and running maxima of their right sides.
+    """
+
+    def __init__(self, top):
+        self.top = top
+        self.bottom = top
+        self.lefts = []
+        self.rights = []
+        self.indices = []
 
 
 class GDrawing(object):
+    """
+    Zones laid out left to right in rows (shelves) and shown through a
+    pannable, zoomable viewport.
+
+    The layout is extended incrementally by ``add_zone`` and fully
+    recomputed only after a zone has changed. Shelves are ordered by
+    ``top`` and zones inside a shelf by ``left``, so the zones
+    intersecting a rectangle are found by binary search, and ``draw``
+    only touches the zones inside of the viewport.
+    """
+
     def __init__(self, scale, width, height):
         self.xoffset = XOFFSET
         self.yoffset = YOFFSET
@@ -153,19 +329,131 @@ class GDrawing(object):
         self.height = height
         self.scale = scale
         self.zones = []
+        self.view_x, self.view_y, self.zoom = 0., 0., 1.
+        self.invalidate_layout()
 
     def add_zone(self, zone):
+        zone.drawing = self
         self.zones.append(zone)
+        if self._placed == len(self.zones) - 1:
+            self._place(len(self.zones) - 1)
 
-    def draw(self):
-        left, top = self.xoffset, self.yoffset
-        right, bottom = left, top
-        for zone in self.zones:
-            zw, zh = self.scale * zone.width, self.scale * zone.height
-            if left + zw > self.width - self.xoffset:
+    def invalidate_layout(self):
+        self.positions = []
+        self.bounds = []
+        self.shelves = []
+        self.shelf_bottoms = []
+        # how far zone contents (e.g. circles) reach left of or above
+        # the position of their zone
+        self._overhang = (0, 0)
+        self._cursor = (self.xoffset, self.yoffset, self.yoffset)
+        self._placed = 0
+
+    def _update_layout(self):
+        while self._placed < len(self.zones):
+            self._place(self._placed)
+
+    def _place(self, index):
+        zone = self.zones[index]
+        left, top, bottom = self._cursor
+        zw, zh = self.scale * zone.width, self.scale * zone.height
+        if left + zw > self.width - self.xoffset or not self.shelves:
+            if self.shelves:
                 top = bottom + self.yoffset
                 left = self.xoffset
-            zone.draw(left, top, self.scale)
-            left = left + zw + self.xoffset
-            if top + zh > bottom:
-                bottom = top + zh
+            self.shelves.append(Shelf(top))
+            self.shelf_bottoms.append(top)
+        bounds = (left + self.scale * zone.min_x,
+                  top + self.scale * zone.min_y,
+                  left + zw + self.scale, top + zh + self.scale)
+        self.positions.append((left, top))
+        self.bounds.append(bounds)
+
+        self._overhang = (max(self._overhang[0], left - bounds[0]),
+                          max(self._overhang[1], top - bounds[1]))
+        shelf = self.shelves[-1]
+        shelf.lefts.append(left)
+        shelf.rights.append(max(shelf.rights[-1:] + [bounds[2]]))
+        shelf.indices.append(index)
+        shelf.bottom = max(shelf.bottom, bounds[3])
+        self.shelf_bottoms[-1] = shelf.bottom
+
+        left = left + zw + self.xoffset
+        if top + zh > bottom:
+            bottom = top + zh
+        self._cursor = (left, top, bottom)
+        self._placed = index + 1
+
+    def layout(self):
+        """Yield every zone with the (left, top) position it is drawn at."""
+        self._update_layout()
+        for zone, (left, top) in zip(self.zones, self.positions):
+            yield zone, left, top
+
+    def zones_in(self, x0, y0, x1, y1):
+        """Yield (zone, left, top) of zones intersecting a rectangle."""
+        self._update_layout()
+        reach_x, reach_y = self._overhang
+        first = bisect.bisect_left(self.shelf_bottoms, y0)
+        for shelf in self.shelves[first:]:
+            if shelf.top > y1 + reach_y:
+                break
+            start = bisect.bisect_left(shelf.rights, x0)
+            stop = bisect.bisect_right(shelf.lefts, x1 + reach_x)
+            for index in shelf.indices[start:stop]:
+                left, top, right, bottom = self.bounds[index]
+                if left <= x1 and top <= y1 and bottom >= y0:
+                    zone = self.zones[index]
+                    yield (zone, ) + self.positions[index]
+
+    @property
+    def viewport(self):
+        """Visible rectangle in layout coordinates."""
+        return (self.view_x, self.view_y,
+                self.view_x + self.width / self.zoom,
+                self.view_y + self.height / self.zoom)
+
+    def pan(self, dx, dy):
+        """Move the viewport by (dx, dy) screen pixels."""
+        self.view_x += dx / self.zoom
+        self.view_y += dy / self.zoom
+
+    def zoom_by(self, factor):
+        """Zoom keeping the center of the viewport in place."""
+        x0, y0, x1, y1 = self.viewport
+        self.zoom *= factor
+        self.view_x = (x0 + x1) / 2. - self.width / self.zoom / 2.
+        self.view_y = (y0 + y1) / 2. - self.height / self.zoom / 2.
+
+    @property
+    def page_height(self):
+        return self.height / self.zoom
+
+    @property
+    def page_count(self):
+        self._update_layout()
+        if not self.shelves:
+            return 1
+        return int(math.ceil(self.shelves[-1].bottom / self.page_height))
+
+    def show_page(self, page):
+        """Scroll the viewport to a page of the layout, counting from 0."""
+        page = max(0, min(page, self.page_count - 1))
+        self.view_x = 0.
+        self.view_y = page * self.page_height
+
+    @property
+    def page(self):
+        return int((self.view_y + self.page_height / 2.) // self.page_height)
+
+    @instrument.timed('render')
+    def draw(self):
+        GL = _opengl()
+        GL.glPushMatrix()
+        GL.glScalef(self.zoom, self.zoom, 1)
+        GL.glTranslatef(-self.view_x, -self.view_y, 0)
+        try:
+            for zone, left, top in self.zones_in(*self.viewport):
+                zone.draw(left, top, self.scale)
+        finally:
+            GL.glPopMatrix()
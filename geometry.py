@@ -0,0 +1,103 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Geometric predicates on plain coordinates.
+
+Everything here takes and returns numbers only, so the hull and circle
+code can test points without creating ``Point`` or ``Circle`` objects
+for intermediate vectors. That includes the steps of Welzl's minimum
+enclosing circle, shared by ``algorithm`` and ``incremental``.
+"""
+
+from settings import EPS
+
+
+def orient(ax, ay, bx, by, cx, cy):
+    """
+    Twice the signed area of triangle (a, b, c): > 0 if the turn from
+    (a, b) to (a, c) is counterclockwise, < 0 if it is clockwise and 0 if
+    the points are collinear.
+    """
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def dist2(ax, ay, bx, by):
+    return (ax - bx) ** 2 + (ay - by) ** 2
+
+
+def distance(ax, ay, bx, by):
+    return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5
+
+
+def incircle(cx, cy, r, px, py):
+    """Check whether (px, py) lies in the circle, up to ``EPS``."""
+    return r * r - ((px - cx) ** 2 + (py - cy) ** 2) > -EPS
+
+
+def circumcircle(ax, ay, bx, by, cx, cy):
+    """
+    Return center and squared radius of the circle through three points.
+
+    Collinear points get the circle built on their farthest pair, the
+    smallest one enclosing all three.
+    """
+    bx, by, cx, cy = bx - ax, by - ay, cx - ax, cy - ay
+    det = 2. * (bx * cy - by * cx)
+    b2, c2 = bx * bx + by * by, cx * cx + cy * cy
+    if abs(det) < EPS:
+        # the farthest pair is (a, b), (a, c) or (b, c)
+        bc2 = (bx - cx) ** 2 + (by - cy) ** 2
+        if bc2 >= b2 and bc2 >= c2:
+            return ax + (bx + cx) / 2., ay + (by + cy) / 2., bc2 / 4.
+        if b2 >= c2:
+            return ax + bx / 2., ay + by / 2., b2 / 4.
+        return ax + cx / 2., ay + cy / 2., c2 / 4.
+    ux = (cy * b2 - by * c2) / det
+    uy = (bx * c2 - cx * b2) / det
+    return ax + ux, ay + uy, ux * ux + uy * uy
+
+
+def min_circle(coords):
+    """
+    Return ``(cx, cy, r2, rebuilds)``: center and squared radius of the
+    minimum circle enclosing non-empty ``coords`` and how many times a
+    circle was rebuilt. Expected time is linear for shuffled coords.
+    """
+    cx, cy = coords[0]
+    r2, rebuilds = 0., 0
+    for i in xrange(1, len(coords)):
+        px, py = coords[i]
+        if r2 - ((px - cx) ** 2 + (py - cy) ** 2) > -EPS:
+            continue
+        cx, cy, r2, steps = min_circle_with_point(coords, i, px, py)
+        rebuilds += steps + 1
+    return cx, cy, r2, rebuilds
+
+
+def min_circle_with_point(coords, count, px, py):
+    """
+    Same as ``min_circle`` for the first ``count`` coords with (px, py)
+    on the boundary of the circle.
+    """
+    cx, cy, r2, rebuilds = px, py, 0., 0
+    for j in xrange(count):
+        qx, qy = coords[j]
+        if r2 - ((qx - cx) ** 2 + (qy - cy) ** 2) > -EPS:
+            continue
+        cx, cy, r2, steps = min_circle_with_points(coords, j, px, py,
+                                                   qx, qy)
+        rebuilds += steps + 1
+    return cx, cy, r2, rebuilds
+
+
+def min_circle_with_points(coords, count, px, py, qx, qy):
+    """Same as ``min_circle_with_point`` with two fixed boundary points."""
+    cx, cy = (px + qx) / 2., (py + qy) / 2.
+    r2, rebuilds = ((px - qx) ** 2 + (py - qy) ** 2) / 4., 0
+    for k in xrange(count):
+        sx, sy = coords[k]
+        if r2 - ((sx - cx) ** 2 + (sy - cy) ** 2) > -EPS:
+            continue
+        rebuilds += 1
+        cx, cy, r2 = circumcircle(px, py, qx, qy, sx, sy)
+    return cx, cy, r2, rebuilds
@@ -0,0 +1,142 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+"""
+
+import random
+
+import geometry
+from algorithm import GlyphConvexHull
+from settings import HORIZONTAL, EPS
+from structures import Glyph, Point, Circle
+
+
+class TrackedGlyph(Glyph):
+    """
+    Glyph maintaining its convex hull and minimum enclosing circle while
+    lines are added one by one.
+
+    A new line only contributes its two end points. A point inside of the
+    hull and of the circle costs one pass over the hull edges and nothing
+    else. A point outside of the hull replaces the chain of hull edges it
+    sees. A point outside of the circle must lie on the boundary of the new
+    circle, so only the constrained steps of Welzl's algorithm are run over
+    the hull vertices.
+
+    Removing lines or adding them in bulk makes both structures stale;
+    they are rebuilt from scratch the next time they are asked for.
+    """
+
+    def __init__(self, orientation, capacity=16, seed=None):
+        Glyph.__init__(self, orientation, capacity)
+        self._hull = []
+        self._circle = None
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_arrays(cls, orientation, x, y, l):
+        glyph = super(TrackedGlyph, cls).from_arrays(orientation, x, y, l)
+        glyph.invalidate()
+        return glyph
+
+    def invalidate(self):
+        self._hull = None
+        self._circle = None
+
+    def add_line(self, line):
+        Glyph.add_line(self, line)
+        if self._hull is None:
+            return
+        if self.orientation == HORIZONTAL:
+            end = (line.x + line.l - 1, line.y)
+        else:
+            end = (line.x, line.y + line.l - 1)
+        for px, py in ((line.x, line.y), end):
+            self._add_to_hull(px, py)
+            self._add_to_circle(float(px), float(py))
+
+    def extend(self, x, y, l):
+        Glyph.extend(self, x, y, l)
+        self.invalidate()
+
+    def remove_line(self, index):
+        line = Glyph.remove_line(self, index)
+        self.invalidate()
+        return line
+
+    def _rebuild(self):
+        self._hull = [(point.x, point.y)
+                        for point in GlyphConvexHull(self).points]
+        self._circle = None
+        coords = [(float(x), float(y)) for x, y in self._hull]
+        if coords:
+            self._random.shuffle(coords)
+            self._circle = geometry.min_circle(coords)[:3]
+
+    @property
+    def hull(self):
+        """Convex hull vertices in counterclockwise order."""
+        if self._hull is None:
+            self._rebuild()
+        return [Point(x, y) for x, y in self._hull]
+
+    @property
+    def circle(self):
+        """Minimum enclosing circle or None for an empty glyph."""
+        if self._hull is None:
+            self._rebuild()
+        if self._circle is None:
+            return None
+        cx, cy, r2 = self._circle
+        return Circle(cx, cy, r2 ** 0.5)
+
+    def _add_to_hull(self, px, py):
+        hull = self._hull
+        n = len(hull)
+        if n == 0 or (n == 1 and hull[0] != (px, py)):
+            hull.append((px, py))
+            return
+        if n == 1:
+            return
+
+        turns = []
+        for i in xrange(n):
+            (ax, ay), (bx, by) = hull[i], hull[(i + 1) % n]
+            turns.append((bx - ax) * (py - ay) - (by - ay) * (px - ax))
+        if n == 2:
+            self._add_to_segment(px, py, turns[0])
+            return
+        if min(turns) >= 0:
+            return
+
+        # Edges not seeing the point strictly from inside form one
+        # contiguous chain; its inner vertices are dropped.
+        first = next(i for i in xrange(n)
+                        if turns[i] <= 0 and turns[i - 1] > 0)
+        last = first
+        while turns[(last + 1) % n] <= 0:
+            last += 1
+        kept = [hull[(last + 1 + k) % n] for k in xrange(n - (last - first))]
+        self._hull = kept + [(px, py)]
+
+    def _add_to_segment(self, px, py, turn):
+        (ax, ay), (bx, by) = self._hull
+        if turn > 0:
+            self._hull = [(ax, ay), (bx, by), (px, py)]
+        elif turn < 0:
+            self._hull = [(ax, ay), (px, py), (bx, by)]
+        else:
+            # collinear: keep the two extreme points
+            points = sorted([(ax, ay), (bx, by), (px, py)])
+            self._hull = [points[0], points[-1]]
+
+    def _add_to_circle(self, px, py):
+        if self._circle is None:
+            self._circle = (px, py, 0.)
+            return
+        cx, cy, r2 = self._circle
+        if r2 - ((px - cx) ** 2 + (py - cy) ** 2) > -EPS:
+            return
+        coords = [(float(x), float(y)) for x, y in self._hull]
+        self._random.shuffle(coords)
+        self._circle = geometry.min_circle_with_point(coords, len(coords),
+                                                      px, py)[:3]
@@ -0,0 +1,235 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Lightweight instrumentation of the glyph pipeline.
+
+Code marks its stages and counts what its algorithms do::
+
+    with instrument.stage('hull'):
+        ...
+        instrument.count('hull_size', len(points))
+
+or decorate a whole function with ``instrument.timed('hull')``.
+
+Nothing is measured until a sink is enabled: ``stage`` then hands out a
+shared no-op context and ``count`` returns right away. With sinks, every
+finished stage produces one event, a dict with the stage ``name``, its
+wall ``time`` in seconds, its ``peak`` traced memory in bytes and the
+``counters`` recorded inside of it. Counters recorded outside of any
+stage produce an event with ``name`` None.
+
+Peak memory comes from ``tracemalloc`` while it is tracing
+(``tracemalloc.start()``). Without the module, as on Python 2, it is the
+growth of the peak resident set size of the process during the stage,
+which stays 0 for stages below an earlier peak. Otherwise it is None.
+
+Running the module checks that an ``Aggregator`` table can be built.
+"""
+
+import functools
+import json
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# ru_maxrss is in KiB, except on OS X where it is in bytes
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+_sinks = []
+_stack = []
+
+
+def enable(sink):
+    _sinks.append(sink)
+
+
+def disable(sink=None):
+    """Remove a sink, or all of them."""
+    if sink is None:
+        del _sinks[:]
+    else:
+        _sinks.remove(sink)
+
+
+def enabled():
+    return bool(_sinks)
+
+
+def _emit(event):
+    for sink in _sinks:
+        sink.record(event)
+
+
+def _tracing():
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+
+def _max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+class _NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    def __init__(self, name):
+        self.name = name
+        self.counters = {}
+        self.peak = None
+        self.rss = None
+
+    def __enter__(self):
+        if _tracing():
+            self.base = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self.peak = 0
+        elif tracemalloc is None and resource is not None:
+            self.rss = _max_rss()
+        _stack.append(self)
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.time() - self.started
+        _stack.pop()
+        if self.peak is not None and _tracing():
+            self.peak = max(self.peak,
+                            tracemalloc.get_traced_memory()[1] - self.base)
+            if _stack and _stack[-1].peak is not None:
+                parent = _stack[-1]
+                parent.peak = max(parent.peak,
+                                  self.base - parent.base + self.peak)
+        elif self.rss is not None:
+            # the peak only grows, so it covers nested stages as well
+            self.peak = _max_rss() - self.rss
+        _emit({'name': self.name, 'time': elapsed, 'peak': self.peak,
+               'counters': self.counters})
+        return False
+
+
+def stage(name):
+    """Return a context manager measuring a pipeline stage."""
+    if not _sinks:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def timed(name):
+    """Decorate a function to run it as a stage."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, value=1):
+    """Add ``value`` to a counter of the innermost running stage."""
+    if not _sinks:
+        return
+    if _stack:
+        counters = _stack[-1].counters
+        counters[name] = counters.get(name, 0) + value
+    else:
+        _emit({'name': None, 'time': 0., 'peak': None,
+               'counters': {name: value}})
+
+
+class JsonLinesSink(object):
+    """Write every event as one JSON object per line."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def record(self, event):
+        self.stream.write(json.dumps(event, sort_keys=True) + '\n')
+
+
+class StageSummary(object):
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.time = 0.
+        self.max_time = 0.
+        self.peak = None
+        self.counters = {}
+
+    def add(self, event):
+        self.calls += 1
+        self.time += event['time']
+        self.max_time = max(self.max_time, event['time'])
+        if event['peak'] is not None:
+            self.peak = max(self.peak, event['peak'])
+        for name, value in event['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def __repr__(self):
+        return "<StageSummary %s: %i calls, %.6f s>" %\
+            (self.name, self.calls, self.time)
+
+
+class Aggregator(object):
+    """Keep per-stage totals of all events in memory."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, event):
+        name = event['name'] or '-'
+        if name not in self.stages:
+            self.stages[name] = StageSummary(name)
+        self.stages[name].add(event)
+
+    def table(self):
+        """Return the totals as a plain-text table, slowest stage first."""
+        lines = ['%-10s %8s %12s %12s %12s  %s' %
+                 ('stage', 'calls', 'total ms', 'mean ms', 'peak KiB',
+                  'counters')]
+        for summary in sorted(self.stages.values(),
+                              key=lambda summary: -summary.time):
+            peak = '-' if summary.peak is None else\
+                '%.1f' % (summary.peak / 1024., )
+            counters = ', '.join('%s=%s' % item
+                                 for item in sorted(summary.counters.items()))
+            lines.append(('%-10s %8i %12.3f %12.3f %12s  %s' %
+                          (summary.name, summary.calls, 1000. * summary.time,
+                           1000. * summary.time / summary.calls, peak,
+                           counters)).rstrip())
+        return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    aggregator = Aggregator()
+    enable(aggregator)
+    with stage('outer'):
+        count('items', 2)
+        with stage('inner'):
+            scratch = [0] * 100000
+    count('loose')
+    disable(aggregator)
+    table = aggregator.table()
+    print table
+    assert len(table.splitlines()) == 4
+    assert aggregator.stages['outer'].counters == {'items': 2}
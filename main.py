@@ -4,10 +4,11 @@ Authors: Nastia Merlits, Kostia Balitsky
 
 import sys
 
+import instrument
+import raster
 import reader
 from structures import VERTICAL, HORIZONTAL, Point, Glyph, Circle
-from algorithm import (Converter, ConvexHull, NaiveEnclosingCircle,
-                        LinearEnclosingCircle)
+from algorithm import Converter, GlyphConvexHull, LinearEnclosingCircle
 from gelements import GDrawing, GZone, GLine, GPoint, GCircle
 from drawer import run_gui
 import settings
@@ -19,8 +20,8 @@ class DrawingAdapter(object):
                                 height=settings.HEIGHT)
 
     def _elements_for_glyph(self, glyph):
-        return [GLine(line.x, line.y, line.l, glyph.orientation)
-                                                    for line in glyph.lines]
+        return [GLine(x, y, l, glyph.orientation) for x, y, l in
+                    zip(glyph.x.tolist(), glyph.y.tolist(), glyph.l.tolist())]
 
     def _elements_for_point(self, point):
         return [GPoint(point.x, point.y)]
@@ -51,16 +52,16 @@ class DrawingAdapter(object):
 
 class ConvexHullAdapter(object):
     def __init__(self, glyph):
-        points = [Point(line.x, line.y) for line in glyph.lines]
-        if glyph.orientation == HORIZONTAL:
-            points.extend([Point(line.x + line.l - 1, line.y)
-                                for line in glyph.lines])
-        else:
-            points.extend([Point(line.x, line.y + line.l - 1)
-                                for line in glyph.lines])
-        self.points = ConvexHull(points).points
+        self.points = GlyphConvexHull(glyph).points
 
 if __name__ == "__main__":
+    profile = '--profile' in sys.argv[1:]
+    if profile:
+        aggregator = instrument.Aggregator()
+        instrument.enable(aggregator)
+        if instrument.tracemalloc is not None:
+            instrument.tracemalloc.start()
+
     glyph = reader.from_tripples(sys.stdin.read(), HORIZONTAL)
     adapter = DrawingAdapter()
 
@@ -68,14 +69,15 @@ if __name__ == "__main__":
     
     print 'Initial glyph:'
     print glyph
-    print [(line.x, line.y, line.l) for line in glyph.lines]
+    print zip(glyph.x.tolist(), glyph.y.tolist(), glyph.l.tolist())
     print '-'*50 + '\n'
     adapter.add_zone(glyph)
 
     converted = Converter().run(glyph)
     print 'Converted glyph:'
     print converted
-    print [(line.x, line.y, line.l) for line in converted.lines]
+    print zip(converted.x.tolist(), converted.y.tolist(),
+              converted.l.tolist())
     print '-'*50 + '\n'
     adapter.add_zone(converted)
 
@@ -85,16 +87,18 @@ if __name__ == "__main__":
     print '-'*50 + '\n'
     adapter.add_zone(hull)
 
-    circle = NaiveEnclosingCircle(hull).circle
-    print 'Enclosing circle (by naive algorithm):'
+    circle = LinearEnclosingCircle(hull).circle
+    print 'Enclosing circle:'
     print circle
     print '-'*50 + '\n'
     adapter.add_zone(glyph, circle)
 
-    # lcircle = LinearEnclosingCircle(hull[2:6]).circle
-    # print 'Enclosing circle (by linear algoritm):'
-    # print lcircle
-    # print '-'*50 + '\n'
-    # adapter.add_zone(glyph, lcircle)
+    if profile:
+        # the window draws only after the table is printed, so time an
+        # offscreen render of the same drawing
+        raster.render_drawing(adapter.drawing)
+        print 'Profile:'
+        print aggregator.table()
+        print '-'*50 + '\n'
 
     run_gui(adapter.drawing)
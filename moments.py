@@ -0,0 +1,146 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Image moments of run-encoded glyphs.
+
+Along a run only one coordinate changes, so the sums of its powers over
+the run are given by closed-form power sums and every raw moment up to
+the third order is a weighted sum over runs; the cost is O(runs) and no
+pixel is ever visited. Coordinates are shifted to the bounding box
+corner first to keep the sums small.
+"""
+
+import math
+
+import numpy
+
+import runs
+from settings import HORIZONTAL
+
+
+def power_sums(start, stop, order=3):
+    """
+    Return a list with sums of ``t ** k`` over ``start <= t < stop`` for
+    ``k`` up to ``order``, one array per power.
+    """
+    last = numpy.asarray(stop, dtype=float) - 1
+    before = numpy.asarray(start, dtype=float) - 1
+    # Faulhaber's polynomials F(n) = sum(t ** k, t = 1..n); their
+    # difference over any integer range is the sum over that range.
+    polynomials = [
+        lambda n: n,
+        lambda n: n * (n + 1) / 2.,
+        lambda n: n * (n + 1) * (2 * n + 1) / 6.,
+        lambda n: (n * (n + 1) / 2.) ** 2,
+    ]
+    return [polynomial(last) - polynomial(before)
+                for polynomial in polynomials[:order + 1]]
+
+
+class Moments(object):
+    """
+    Area, centroid, central moments, orientation and Hu invariants of a
+    glyph.
+
+    ``raw`` and ``central`` map ``(p, q)`` to the moments of order
+    ``p + q <= 3`` in glyph coordinates (``x`` goes with ``p``).
+    ``angle`` is the orientation of the major axis in radians, ``hu``
+    the seven Hu invariants. An empty glyph has zero area, centroid
+    None and all other values zero.
+    """
+
+    ORDERS = [(p, q) for p in xrange(4) for q in xrange(4) if p + q <= 3]
+
+    def __init__(self, glyph):
+        level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+        self.raw = dict((key, 0.) for key in self.ORDERS)
+        self.central = dict(self.raw)
+        self.area = 0
+        self.centroid = None
+        self.angle = 0.
+        self.hu = (0., ) * 7
+        if not len(level):
+            return
+
+        level_base, pos_base = level.min(), start.min()
+        sums = power_sums(start - pos_base, stop - pos_base)
+        level = (level - level_base).astype(float)
+        level_powers = [numpy.ones(len(level)), level, level ** 2,
+                        level ** 3]
+        shifted = {}
+        for p, q in self.ORDERS:
+            # p goes with x, which is the level of V-glyphs
+            if glyph.orientation == HORIZONTAL:
+                shifted[p, q] = (level_powers[q] * sums[p]).sum()
+            else:
+                shifted[p, q] = (level_powers[p] * sums[q]).sum()
+        if glyph.orientation == HORIZONTAL:
+            x_base, y_base = pos_base, level_base
+        else:
+            x_base, y_base = level_base, pos_base
+
+        area = shifted[0, 0]
+        cx, cy = shifted[1, 0] / area, shifted[0, 1] / area
+        self.area = int(round(area))
+        self.centroid = (x_base + cx, y_base + cy)
+        self.central = self.centralize(shifted, cx, cy)
+        self.raw = self.move(self.central, area, x_base + cx, y_base + cy)
+
+        mu = self.central
+        self.angle = 0.5 * math.atan2(2 * mu[1, 1], mu[2, 0] - mu[0, 2])
+        self.hu = self.invariants()
+
+    def centralize(self, m, cx, cy):
+        """Central moments from raw moments about the same origin."""
+        return {
+            (0, 0): m[0, 0], (1, 0): 0., (0, 1): 0.,
+            (2, 0): m[2, 0] - cx * m[1, 0],
+            (0, 2): m[0, 2] - cy * m[0, 1],
+            (1, 1): m[1, 1] - cx * m[0, 1],
+            (3, 0): m[3, 0] - 3 * cx * m[2, 0] + 2 * cx * cx * m[1, 0],
+            (0, 3): m[0, 3] - 3 * cy * m[0, 2] + 2 * cy * cy * m[0, 1],
+            (2, 1): (m[2, 1] - 2 * cx * m[1, 1] - cy * m[2, 0] +
+                     2 * cx * cx * m[0, 1]),
+            (1, 2): (m[1, 2] - 2 * cy * m[1, 1] - cx * m[0, 2] +
+                     2 * cy * cy * m[1, 0]),
+        }
+
+    def move(self, mu, area, cx, cy):
+        """Raw moments about the origin from central moments."""
+        return {
+            (0, 0): area, (1, 0): cx * area, (0, 1): cy * area,
+            (2, 0): mu[2, 0] + cx * cx * area,
+            (0, 2): mu[0, 2] + cy * cy * area,
+            (1, 1): mu[1, 1] + cx * cy * area,
+            (3, 0): mu[3, 0] + 3 * cx * mu[2, 0] + cx ** 3 * area,
+            (0, 3): mu[0, 3] + 3 * cy * mu[0, 2] + cy ** 3 * area,
+            (2, 1): (mu[2, 1] + 2 * cx * mu[1, 1] + cy * mu[2, 0] +
+                     cx * cx * cy * area),
+            (1, 2): (mu[1, 2] + 2 * cy * mu[1, 1] + cx * mu[0, 2] +
+                     cx * cy * cy * area),
+        }
+
+    def eta(self, p, q):
+        """Scale-invariant normalized central moment."""
+        area = self.central[0, 0]
+        if not area:
+            return 0.
+        return self.central[p, q] / area ** (1 + (p + q) / 2.)
+
+    def invariants(self):
+        n20, n02, n11 = self.eta(2, 0), self.eta(0, 2), self.eta(1, 1)
+        n30, n03 = self.eta(3, 0), self.eta(0, 3)
+        n21, n12 = self.eta(2, 1), self.eta(1, 2)
+        a, b = n30 + n12, n21 + n03
+        c, d = n30 - 3 * n12, 3 * n21 - n03
+        return (n20 + n02,
+                (n20 - n02) ** 2 + 4 * n11 ** 2,
+                c ** 2 + d ** 2,
+                a ** 2 + b ** 2,
+                c * a * (a ** 2 - 3 * b ** 2) + d * b * (3 * a ** 2 - b ** 2),
+                (n20 - n02) * (a ** 2 - b ** 2) + 4 * n11 * a * b,
+                d * a * (a ** 2 - 3 * b ** 2) - c * b * (3 * a ** 2 - b ** 2))
+
+    def __repr__(self):
+        return "<Moments: area %r, centroid %r, angle %r>" %\
+            (self.area, self.centroid, self.angle)
@@ -0,0 +1,210 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Offscreen rendering of glyphs and drawings into NumPy arrays.
+
+Nothing here needs a display or PyOpenGL: runs and rectangles are filled
+with 2-D difference arrays and cumulative sums, so the cost does not
+depend on Python loops over pixels. Images are saved through PIL.
+
+Usage (one PNG thumbnail per corpus glyph):
+
+  ``$ python raster.py input/glyphs.txt thumbnails/ --scale 2``
+"""
+
+import argparse
+import math
+import os
+
+import numpy
+from PIL import Image
+
+import instrument
+from container import open_corpus
+from gelements import GCircle, GLine, GPoint, GZone
+from settings import (BORDER_COLOR, FILL_COLOR, HORIZONTAL, VERTICAL)
+
+INK = 255
+
+
+@instrument.timed('render')
+def rasterize_glyph(glyph, scale=1):
+    """
+    Return a ``uint8`` bitmap of a glyph cropped to its bounding box.
+
+    Rows of the bitmap go along ``y`` and columns along ``x``; set pixels
+    are ``INK``, the rest is 0. Every glyph pixel becomes a
+    ``scale`` x ``scale`` square.
+    """
+    if not len(glyph):
+        return numpy.zeros((0, 0), dtype=numpy.uint8)
+    x, y, l = glyph.x, glyph.y, glyph.l
+    x0, y0 = x.min(), y.min()
+    if glyph.orientation == HORIZONTAL:
+        x1, y1 = (x + l).max(), y.max() + 1
+    else:
+        x1, y1 = x.max() + 1, (y + l).max()
+
+    diff = numpy.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=numpy.int32)
+    numpy.add.at(diff, (y - y0, x - x0), 1)
+    if glyph.orientation == HORIZONTAL:
+        numpy.add.at(diff, (y - y0, x + l - x0), -1)
+        covered = diff.cumsum(axis=1)
+    else:
+        numpy.add.at(diff, (y + l - y0, x - x0), -1)
+        covered = diff.cumsum(axis=0)
+    bitmap = numpy.where(covered[:-1, :-1] > 0, INK, 0).astype(numpy.uint8)
+    if scale != 1:
+        bitmap = bitmap.repeat(scale, axis=0).repeat(scale, axis=1)
+    return bitmap
+
+
+def save_png(pixels, path):
+    Image.fromarray(pixels).save(path, 'PNG')
+
+
+class Canvas(object):
+    """
+    RGB image with the coordinate system of ``drawer.MainWindow``: the
+    origin is in the bottom-left corner and ``y`` goes up.
+    """
+
+    def __init__(self, width, height, background=(0., 0., 0.)):
+        self.width = width
+        self.height = height
+        self.pixels = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.pixels[:] = self.color(background)
+
+    def color(self, rgb):
+        return [int(round(channel * 255)) for channel in rgb]
+
+    def fill_rects(self, left, top, right, bottom, rgb):
+        """
+        Fill rectangles given by arrays of inclusive bounds, ``top`` being
+        the smaller ``y`` as in the GL code.
+        """
+        left = numpy.clip(numpy.asarray(left), 0, self.width)
+        right = numpy.clip(numpy.asarray(right) + 1, 0, self.width)
+        low = numpy.clip(self.height - 1 - numpy.asarray(bottom),
+                         0, self.height)
+        high = numpy.clip(self.height - numpy.asarray(top), 0, self.height)
+        visible = (left < right) & (low < high)
+        left, right = left[visible], right[visible]
+        low, high = low[visible], high[visible]
+        if not len(left):
+            return
+
+        diff = numpy.zeros((self.height + 1, self.width + 1),
+                           dtype=numpy.int32)
+        numpy.add.at(diff, (low, left), 1)
+        numpy.add.at(diff, (low, right), -1)
+        numpy.add.at(diff, (high, left), -1)
+        numpy.add.at(diff, (high, right), 1)
+        covered = diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+        self.pixels[covered] = self.color(rgb)
+
+    def outline_rects(self, left, top, right, bottom, rgb):
+        left, top = numpy.asarray(left), numpy.asarray(top)
+        right, bottom = numpy.asarray(right), numpy.asarray(bottom)
+        self.fill_rects(numpy.concatenate([left, left, left, right]),
+                        numpy.concatenate([top, bottom, top, top]),
+                        numpy.concatenate([right, right, left, right]),
+                        numpy.concatenate([top, bottom, bottom, bottom]),
+                        rgb)
+
+    def circle(self, cx, cy, rad, rgb):
+        steps = max(8, int(4 * math.pi * rad))
+        angles = numpy.linspace(-math.pi, math.pi, steps, endpoint=False)
+        xs = (cx + numpy.cos(angles) * rad).astype(int)
+        ys = (cy + numpy.sin(angles) * rad).astype(int)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        self.pixels[self.height - 1 - ys[inside], xs[inside]] = self.color(rgb)
+
+    def save(self, path):
+        save_png(self.pixels, path)
+
+
+class DrawingRasterizer(object):
+    """Render a ``gelements.GDrawing`` onto a ``Canvas``."""
+
+    def __init__(self, drawing):
+        self.drawing = drawing
+        self.rects = []
+        self.circles = []
+
+    def _collect_point(self, element, x, y, scale):
+        left, top = x + element.x * scale, y + element.y * scale
+        self.rects.append((left, top, left + scale - 1, top + scale - 1))
+
+    def _collect_line(self, element, x, y, scale):
+        left, top = x + element.x * scale, y + element.y * scale
+        right, bottom = left + scale - 1, top + scale - 1
+        if element.orientation == HORIZONTAL:
+            right = right + scale * (element.l - 1)
+        else:
+            bottom = bottom + scale * (element.l - 1)
+        self.rects.append((left, top, right, bottom))
+
+    def _collect_circle(self, element, x, y, scale):
+        self.circles.append((x + element.x * scale + scale / 2,
+                             y + element.y * scale + scale / 2,
+                             element.r * scale))
+
+    def _collect_zone(self, zone, x, y, scale):
+        for element in zone.elements:
+            self._collect(element, x, y, scale)
+
+    def _collect(self, element, x, y, scale):
+        mapping = {
+            GPoint: self._collect_point,
+            GLine: self._collect_line,
+            GCircle: self._collect_circle,
+            GZone: self._collect_zone}
+        mapping[type(element)](element, x, y, scale)
+
+    @instrument.timed('render')
+    def run(self):
+        drawing = self.drawing
+        canvas = Canvas(drawing.width, drawing.height)
+        self.rects, self.circles = [], []
+        for zone, left, top in drawing.zones_in(0, 0, drawing.width,
+                                                drawing.height):
+            self._collect(zone, left, top, drawing.scale)
+
+        if self.rects:
+            bounds = numpy.array(self.rects).astype(int).T
+            canvas.fill_rects(*(tuple(bounds) + (FILL_COLOR, )))
+            canvas.outline_rects(*(tuple(bounds) + (BORDER_COLOR, )))
+        for cx, cy, rad in self.circles:
+            canvas.circle(cx, cy, rad, BORDER_COLOR)
+        return canvas
+
+
+def render_drawing(drawing):
+    return DrawingRasterizer(drawing).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render PNG thumbnails of every glyph of a corpus.")
+    parser.add_argument('corpus')
+    parser.add_argument('directory')
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--horizontal', action='store_true',
+                        help="rows without an orientation flag "
+                             "are horizontal")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        os.makedirs(args.directory)
+    orientation = HORIZONTAL if args.horizontal else VERTICAL
+    with open_corpus(args.corpus, orientation) as corpus:
+        width = len(str(len(corpus)))
+        for index, record in enumerate(corpus):
+            path = os.path.join(args.directory,
+                                '%0*i.png' % (width, index))
+            save_png(rasterize_glyph(record.glyph, args.scale), path)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,19 +3,164 @@ Authors: Nastia Merlits, Kostia Balitsky
 """
 
 import itertools
+import mmap
+
+import numpy
+
+import instrument
 import structures
+from settings import HORIZONTAL, VERTICAL
 
 class ImpoperInputFormat(Exception):
     pass
 
+@instrument.timed('parse')
 def from_tripples(input, orientation):
-    glyph = structures.Glyph(orientation)
-    nums = [long(item) for item in input.split()]
-    tripples = [ nums[i:i+3]
-                    for i in xrange(0, len(nums), 3)]
-    if len(tripples) !=0 and len(tripples[-1]) != 3:
+    nums = numpy.array(input.split(), dtype=structures.Glyph.DTYPE)
+    if len(nums) % 3 != 0:
         raise ImpoperInputFormat("Total number of integers "
                                  "should be multiple of 3")
-    for x, y, l in tripples:
-        glyph.add_line(structures.Line(x, y, l))
-    return glyph
+    x, y, l = nums.reshape(-1, 3).T
+    return structures.Glyph.from_arrays(orientation, x, y, l)
+
+
+def from_bitmap(image, orientation, threshold=128, crop=True):
+    """
+    Build a glyph from a PIL image or a 2-D NumPy array.
+
+    Boolean arrays are taken as they are, ``True`` being ink. Images and
+    numeric arrays are converted to grayscale and pixels darker than
+    ``threshold`` become ink. Rows of the bitmap go along ``y`` and
+    columns along ``x``. With ``crop`` the glyph is moved to the origin
+    of its bounding box.
+
+    Runs are extracted for all rows at once from the places where a
+    padded row changes its value, so no Python loop touches pixels.
+    """
+    if not isinstance(image, numpy.ndarray):
+        image = numpy.asarray(image.convert('L'))
+    if image.ndim != 2:
+        raise ImpoperInputFormat("Bitmap should be 2-dimensional, got "
+                                 "shape %r" % (image.shape, ))
+    if image.dtype == bool:
+        ink = image
+    else:
+        ink = image < threshold
+
+    if crop:
+        rows = numpy.flatnonzero(ink.any(axis=1))
+        cols = numpy.flatnonzero(ink.any(axis=0))
+        if len(rows) == 0:
+            return structures.Glyph(orientation)
+        ink = ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+    if orientation == VERTICAL:
+        ink = ink.T
+    padded = numpy.zeros((ink.shape[0], ink.shape[1] + 2), dtype=bool)
+    padded[:, 1:-1] = ink
+    # edges come in pairs in row-major order: a run start, then its end
+    level, edge = numpy.nonzero(padded[:, 1:] != padded[:, :-1])
+    level, start, stop = level[::2], edge[::2], edge[1::2]
+
+    if orientation == VERTICAL:
+        return structures.Glyph.from_arrays(orientation, level, start,
+                                            stop - start)
+    return structures.Glyph.from_arrays(orientation, start, level,
+                                        stop - start)
+
+
+class Corpus(object):
+    """
+    Random-access reader for the tab-separated multi-glyph corpus format.
+
+    Every row of a corpus file (see ``input/glyphs.txt``) holds a glyph
+    encoding, a bounding box (4 integers), a precomputed enclosing circle
+    (x, y, r) and then the runs of the glyph as (x, y, l) triples. The
+    encoding is the orientation of the runs, ``1`` for vertical and
+    ``0`` for horizontal; ``orientation`` is used for rows with any other
+    encoding.
+
+    The file is memory-mapped and scanned once to build an index of row
+    offsets, so ``corpus[n]`` parses only the n-th row. Iteration yields
+    records lazily in file order.
+    """
+
+    HEADER_FIELDS = 8
+    ORIENTATIONS = {'0': HORIZONTAL, '1': VERTICAL}
+
+    def __init__(self, path, orientation=VERTICAL):
+        self.path = path
+        self.orientation = orientation
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            self._map = None
+        self._offsets = self._build_index()
+
+    def _build_index(self):
+        """Return (start, end) offsets of every non-empty row."""
+        offsets = []
+        if self._map is None:
+            return offsets
+        size = len(self._map)
+        start = 0
+        while start < size:
+            end = self._map.find('\n', start)
+            if end == -1:
+                end = size
+            if end > start and not self._map[start].isspace():
+                offsets.append((start, end))
+            start = end + 1
+        return offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("corpus index out of range")
+        start, end = self._offsets[index]
+        return self.parse_row(self._map[start:end], index)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    @instrument.timed('parse')
+    def parse_row(self, row, index=None):
+        fields = row.split(None, self.HEADER_FIELDS)
+        if len(fields) < self.HEADER_FIELDS:
+            raise ImpoperInputFormat("Row %r has only %i header fields" %
+                                     (index, len(fields)))
+        try:
+            bbox = tuple(int(item) for item in fields[1:5])
+            circle = structures.Circle(*[float(item) for item in fields[5:8]])
+        except ValueError, e:
+            raise ImpoperInputFormat("Row %r has malformed header: %s" %
+                                     (index, e))
+        runs = fields[self.HEADER_FIELDS] if len(fields) > self.HEADER_FIELDS\
+                                          else ''
+        nums = numpy.fromstring(runs, dtype=numpy.int32, sep=' ')
+        if len(nums) % 3 != 0:
+            raise ImpoperInputFormat("Row %r: total number of integers "
+                                     "should be multiple of 3" % (index, ))
+        x, y, l = nums.reshape(-1, 3).T
+        orientation = self.ORIENTATIONS.get(fields[0], self.orientation)
+        glyph = structures.Glyph.from_arrays(orientation, x, y, l)
+        return structures.GlyphRecord(fields[0], bbox, circle, glyph)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,151 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Vectorized helpers working on glyph runs in "level" form.
+
+A set of runs is described by three equally sized integer arrays
+``(level, start, stop)``: ``level`` is the coordinate shared by all
+pixels of a run (``y`` for H-glyphs, ``x`` for V-glyphs) and the run
+covers ``start <= dim < stop`` along the other coordinate. Runs are
+*normalized* when they are ordered by ``(level, start)`` and no two runs
+of the same level overlap or touch, which is the invariant kept by
+``structures.SegmentSequence`` for a single level.
+"""
+
+import numpy
+
+from settings import HORIZONTAL
+from structures import Glyph
+
+DTYPE = numpy.int64
+
+
+def empty():
+    return (numpy.zeros(0, dtype=DTYPE), numpy.zeros(0, dtype=DTYPE),
+            numpy.zeros(0, dtype=DTYPE))
+
+
+def from_glyph(glyph):
+    """Return runs of a glyph as ``(level, start, stop)``."""
+    if glyph.orientation == HORIZONTAL:
+        level, start = glyph.y, glyph.x
+    else:
+        level, start = glyph.x, glyph.y
+    start = start.astype(DTYPE)
+    return level.astype(DTYPE), start, start + glyph.l
+
+
+def to_glyph(orientation, level, start, stop):
+    """Build a glyph of the given orientation from level-form runs."""
+    if orientation == HORIZONTAL:
+        return Glyph.from_arrays(orientation, start, level, stop - start)
+    return Glyph.from_arrays(orientation, level, start, stop - start)
+
+
+def merge_sorted(level, start, stop):
+    """
+    Merge overlapping and touching runs of the same level.
+
+    Runs must already be ordered by ``(level, start)``.
+    """
+    if len(level) == 0:
+        return empty()
+    level = numpy.asarray(level, dtype=DTYPE)
+    start = numpy.asarray(start, dtype=DTYPE)
+    stop = numpy.asarray(stop, dtype=DTYPE)
+    # Offsetting every level by more than the coordinate span makes the
+    # running maximum of stops restart at each new level.
+    base = min(start.min(), stop.min())
+    span = max(start.max(), stop.max()) - base + 2
+    key = (level - level[0]) * span + (stop - base)
+    reach = numpy.maximum.accumulate(key)
+    first = numpy.ones(len(level), dtype=bool)
+    first[1:] = ((level[1:] != level[:-1]) |
+                 ((level[1:] - level[0]) * span + (start[1:] - base) >
+                  reach[:-1]))
+    heads = numpy.flatnonzero(first)
+    return (level[heads], start[heads],
+            numpy.maximum.reduceat(stop, heads))
+
+
+def normalize(level, start, stop):
+    """Sort runs and merge overlapping or touching ones."""
+    level = numpy.asarray(level, dtype=DTYPE)
+    start = numpy.asarray(start, dtype=DTYPE)
+    stop = numpy.asarray(stop, dtype=DTYPE)
+    keep = stop > start
+    level, start, stop = level[keep], start[keep], stop[keep]
+    if len(level) > 1 and\
+            ((level[1:] > level[:-1]) | ((level[1:] == level[:-1]) &
+                                          (start[1:] >= start[:-1]))).all():
+        # already in order, as glyphs read from a corpus usually are
+        return merge_sorted(level, start, stop)
+    order = numpy.lexsort((start, level))
+    return merge_sorted(level[order], start[order], stop[order])
+
+
+def _sweep(first, second, keep):
+    """
+    Return sorted event ``(level, pos)`` arrays of two run sets and the
+    indices of events followed by a kept piece ``pos[i]:pos[i + 1]``.
+    """
+    (la, sa, ea), (lb, sb, eb) = first, second
+    na, nb = len(la), len(lb)
+    level = numpy.concatenate([la, la, lb, lb]).astype(DTYPE)
+    pos = numpy.concatenate([sa, ea, sb, eb]).astype(DTYPE)
+    if len(level) == 0:
+        return level, pos, numpy.zeros(0, dtype=DTYPE)
+    delta_a = numpy.zeros(len(level), dtype=DTYPE)
+    delta_a[:na], delta_a[na:2 * na] = 1, -1
+    delta_b = numpy.zeros(len(level), dtype=DTYPE)
+    delta_b[2 * na:2 * na + nb], delta_b[2 * na + nb:] = 1, -1
+
+    order = numpy.lexsort((pos, level))
+    level, pos = level[order], pos[order]
+    # Every level's events sum up to zero, so plain cumulative sums give
+    # the coverage of both sets right after each event.
+    inside_a = numpy.cumsum(delta_a[order]) > 0
+    inside_b = numpy.cumsum(delta_b[order]) > 0
+    selected = numpy.flatnonzero(keep(inside_a, inside_b)[:-1] &
+                                 (level[1:] == level[:-1]) &
+                                 (pos[1:] > pos[:-1]))
+    return level, pos, selected
+
+
+def combine(first, second, keep):
+    """
+    Sweep two run sets at once and return the normalized runs covering
+    the positions where ``keep(in_first, in_second)`` holds.
+
+    ``keep`` receives two boolean arrays and must be vectorized, e.g.
+    ``numpy.logical_and``. Inputs do not need to be normalized.
+    """
+    level, pos, selected = _sweep(first, second, keep)
+    if len(selected) == 0:
+        return empty()
+    return merge_sorted(level[selected], pos[selected], pos[selected + 1])
+
+
+def combined_length(first, second, keep):
+    """
+    Return the number of cells of ``combine(first, second, keep)``
+    without building its runs.
+    """
+    level, pos, selected = _sweep(first, second, keep)
+    return int((pos[selected + 1] - pos[selected]).sum())
+
+
+def and_not(first, second):
+    """``keep`` of ``combine`` for cells in the first set only."""
+    return first & ~second
+
+
+def expand(start, stop):
+    """Return ``(index, position)`` of every cell covered by the runs."""
+    lengths = numpy.asarray(stop, dtype=DTYPE) - start
+    total = int(lengths.sum()) if len(lengths) else 0
+    index = numpy.repeat(numpy.arange(len(lengths)), lengths)
+    offsets = numpy.cumsum(lengths) - lengths
+    positions = (numpy.repeat(numpy.asarray(start, dtype=DTYPE), lengths) +
+                 numpy.arange(total, dtype=DTYPE) - offsets[index])
+    return index, positions
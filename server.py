@@ -0,0 +1,421 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Long-running glyph service.
+
+Starting Python and importing NumPy and the algorithms costs far more
+than converting one glyph, so the service pays for it once and answers
+any number of requests over a Unix socket or a localhost TCP port.
+
+The protocol is one JSON object per line both ways. A request holds the
+glyph in the triple format of ``main.py`` and optionally an id and the
+orientation of its runs (``"H"``, the default, or ``"V"``)::
+
+  {"id": 1, "glyph": "0 0 3 0 1 2", "orientation": "H"}
+
+and gets the converted glyph, the convex hull and the enclosing circle::
+
+  {"id": 1, "converted": [[x, y, l], ...], "hull": [[x, y], ...],
+   "circle": [x, y, r]}
+
+or ``{"id": 1, "error": "..."}``. Clients may pipeline requests;
+responses of a connection come back in request order, also after the
+client shut down its sending side. Requests are computed by a pool of
+worker processes, each keeping a warm ``cache.ResultCache``. A
+connection with ``max_pending`` requests in flight is not read from
+until some of them are answered, so a fast client is held back by the
+socket buffers instead of filling the server's memory.
+
+The event loop is ``asyncore``; results come back from pool threads
+through a queue and a pipe waking the loop up.
+
+Usage:
+
+  ``$ python server.py serve /tmp/glyphs.sock --processes 4``
+  ``$ python server.py query /tmp/glyphs.sock < glyph.txt``
+
+An address with a colon, like ``localhost:8765``, is a TCP address.
+"""
+
+import argparse
+import asyncore
+import collections
+import errno
+import fcntl
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+
+import reader
+from cache import ResultCache, glyph_digest
+from settings import HORIZONTAL, VERTICAL
+
+ORIENTATIONS = {'H': HORIZONTAL, 'V': VERTICAL}
+BUFFER_LIMIT = 1 << 20
+
+
+class ServiceError(Exception):
+    pass
+
+
+def parse_address(text):
+    """Return a ``(host, port)`` pair for ``host:port``, else a path."""
+    if ':' in text:
+        host, port = text.rsplit(':', 1)
+        return host or 'localhost', int(port)
+    return text
+
+
+def _family(address):
+    return socket.AF_UNIX if isinstance(address, basestring) else\
+        socket.AF_INET
+
+
+_cache = None
+
+
+def _start_worker(cache_path=None):
+    global _cache
+    _cache = ResultCache(path=cache_path)
+
+
+def describe(text, orientation, cache):
+    """Return the response fields for a glyph in the triple format."""
+    glyph = reader.from_tripples(text, orientation)
+    if not len(glyph):
+        raise ValueError("Glyph has no runs")
+    digest = glyph_digest(glyph)
+    converted = cache.convert(glyph, digest)
+    hull = cache.hull(glyph, digest)
+    circle = cache.circle(glyph, digest, seed=0)
+    return {
+        'converted': zip(converted.x.tolist(), converted.y.tolist(),
+                         converted.l.tolist()),
+        'hull': [(point.x, point.y) for point in hull],
+        'circle': (circle.x, circle.y, circle.r),
+    }
+
+
+def handle_request(line):
+    """Answer one JSON request line with a JSON response line."""
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("Request must be an object")
+    except ValueError, e:
+        return json.dumps({'id': None, 'error': str(e)}) + '\n'
+    response = {'id': request.get('id')}
+    try:
+        orientation = ORIENTATIONS[request.get('orientation', 'H')]
+        response.update(describe(str(request['glyph']), orientation,
+                                 _cache))
+    except KeyError, e:
+        response['error'] = "Missing or unknown field value: %s" % (e, )
+    except Exception, e:
+        # every request must be answered or its connection stalls
+        response['error'] = "%s: %s" % (type(e).__name__, e)
+    return json.dumps(response) + '\n'
+
+
+class Connection(asyncore.dispatcher):
+    """One client: splits requests, keeps their responses in order."""
+
+    def __init__(self, sock, service):
+        asyncore.dispatcher.__init__(self, sock, map=service.map)
+        self.service = service
+        self.incoming = ''
+        self.outgoing = ''
+        # responses in request order, None until computed
+        self.slots = collections.deque()
+        self.first_slot = 0
+        # the client shut its side down, answer what it sent and close
+        self.eof = False
+
+    def readable(self):
+        return (not self.eof and
+                len(self.slots) < self.service.max_pending and
+                len(self.incoming) < BUFFER_LIMIT and
+                len(self.outgoing) < BUFFER_LIMIT)
+
+    def writable(self):
+        return bool(self.outgoing)
+
+    def handle_read(self):
+        # not self.recv, which closes the connection on EOF
+        data = self.socket.recv(65536)
+        if not data:
+            self.eof = True
+            if self.incoming.strip():
+                self.incoming += '\n'
+        self.incoming += data
+        self.dispatch()
+        self.close_when_done()
+
+    def dispatch(self):
+        while len(self.slots) < self.service.max_pending:
+            line, newline, rest = self.incoming.partition('\n')
+            if not newline:
+                break
+            self.incoming = rest
+            if line.strip():
+                slot = self.first_slot + len(self.slots)
+                self.slots.append(None)
+                self.service.submit(self, slot, line)
+
+    def finish(self, slot, response):
+        self.slots[slot - self.first_slot] = response
+        while self.slots and self.slots[0] is not None:
+            self.outgoing += self.slots.popleft()
+            self.first_slot += 1
+        self.dispatch()
+        self.close_when_done()
+
+    def handle_write(self):
+        sent = self.send(self.outgoing)
+        self.outgoing = self.outgoing[sent:]
+        self.close_when_done()
+
+    def close_when_done(self):
+        if self.eof and not self.slots and not self.outgoing:
+            self.close()
+
+    def handle_close(self):
+        self.close()
+
+    def handle_error(self):
+        # a failing client must not stop the service
+        self.close()
+
+
+class _Waker(asyncore.file_dispatcher):
+    """Runs callbacks queued by other threads inside the event loop."""
+
+    def __init__(self, service):
+        self._read, self._write = os.pipe()
+        flags = fcntl.fcntl(self._write, fcntl.F_GETFL)
+        fcntl.fcntl(self._write, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        asyncore.file_dispatcher.__init__(self, self._read, map=service.map)
+        self.queue = collections.deque()
+
+    def call(self, function, *args):
+        # deque.append is atomic, the loop then drains the queue
+        self.queue.append((function, args))
+        try:
+            os.write(self._write, 'x')
+        except OSError, e:
+            # a full pipe wakes the loop up all the same
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        try:
+            self.recv(4096)
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+        while self.queue:
+            function, args = self.queue.popleft()
+            function(*args)
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        os.close(self._write)
+
+
+class GlyphService(asyncore.dispatcher):
+    """
+    Listen at ``address`` and answer glyph requests with a pool of
+    ``processes`` workers sharing the SQLite file ``cache_path``.
+    """
+
+    def __init__(self, address, processes=None, cache_path=None,
+                 max_pending=64):
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.address = address
+        self.max_pending = max_pending
+        self.pool = multiprocessing.Pool(processes, _start_worker,
+                                         (cache_path, ))
+        self.waker = _Waker(self)
+        self.create_socket(_family(address), socket.SOCK_STREAM)
+        if _family(address) == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.unlink(address)
+        else:
+            self.set_reuse_addr()
+        self.bind(address)
+        self.listen(64)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            Connection(pair[0], self)
+
+    def submit(self, connection, slot, line):
+        def done(response):
+            self.waker.call(self._finish, connection, slot, response)
+        self.pool.apply_async(handle_request, (line, ), callback=done)
+
+    def _finish(self, connection, slot, response):
+        if connection.connected:
+            connection.finish(slot, response)
+
+    def serve_forever(self):
+        try:
+            asyncore.loop(timeout=1, map=self.map)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        asyncore.close_all(self.map)
+        self.pool.terminate()
+        self.pool.join()
+        if _family(self.address) == socket.AF_UNIX and\
+                os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class GlyphClient(object):
+    """
+    Blocking client of a ``GlyphService``.
+
+    Glyphs are given in the triple format or as ``Glyph`` objects.
+    Responses are dictionaries as described above; an error response
+    raises ``ServiceError``. Responses of requests nobody waits for
+    anymore are skipped, so the client stays usable after an error; a
+    response out of order or a lost connection make it unusable.
+    """
+
+    def __init__(self, address, timeout=None):
+        if isinstance(address, basestring):
+            address = parse_address(address)
+        self.socket = socket.socket(_family(address), socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(address)
+        self._responses = self.socket.makefile('rb')
+        self._next_id = 0
+        # ids of the requests in flight, oldest first
+        self._pending = collections.deque()
+        self._broken = None
+
+    def _request(self, glyph, orientation):
+        if hasattr(glyph, 'orientation'):
+            orientation = glyph.orientation
+            glyph = ' '.join('%i %i %i' % run for run in
+                             zip(glyph.x.tolist(), glyph.y.tolist(),
+                                 glyph.l.tolist()))
+        self._next_id += 1
+        self._pending.append(self._next_id)
+        request = {'id': self._next_id, 'glyph': glyph,
+                   'orientation': 'H' if orientation == HORIZONTAL else 'V'}
+        return json.dumps(request) + '\n'
+
+    def _fail(self, message):
+        self._broken = message
+        raise ServiceError(message)
+
+    def _response(self):
+        if self._broken:
+            raise ServiceError(self._broken)
+        try:
+            line = self._responses.readline()
+        except socket.error, e:
+            self._fail("Connection failed: %s" % (e, ))
+        if not line:
+            self._fail("Connection closed by the service")
+        response = json.loads(line)
+        expected = self._pending.popleft()
+        if response.get('id') != expected:
+            self._fail("Got response %r for request %r" %
+                       (response.get('id'), expected))
+        if 'error' in response:
+            raise ServiceError(response['error'])
+        return response
+
+    def _drain(self):
+        """Read and drop the responses of all requests in flight."""
+        while self._pending and not self._broken:
+            try:
+                self._response()
+            except ServiceError:
+                pass
+
+    def describe(self, glyph, orientation=HORIZONTAL):
+        return list(self.describe_many([glyph], orientation))[0]
+
+    def describe_many(self, glyphs, orientation=HORIZONTAL, window=32):
+        """
+        Yield responses for many glyphs in order, keeping up to
+        ``window`` requests in flight. Stopping early, or on an error,
+        skips the responses still in flight.
+        """
+        if self._broken:
+            raise ServiceError(self._broken)
+        try:
+            for glyph in glyphs:
+                request = self._request(glyph, orientation)
+                try:
+                    self.socket.sendall(request)
+                except socket.error, e:
+                    self._fail("Connection failed: %s" % (e, ))
+                if len(self._pending) >= window:
+                    yield self._response()
+            while self._pending:
+                yield self._response()
+        finally:
+            self._drain()
+
+    def close(self):
+        self._responses.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve glyph conversions over a socket.")
+    subparsers = parser.add_subparsers(dest='command')
+    serve = subparsers.add_parser('serve', help="run the service")
+    serve.add_argument('address', help="socket path or host:port")
+    serve.add_argument('--processes', type=int, default=None,
+                       help="worker processes (default: one per core)")
+    serve.add_argument('--cache', metavar='PATH', default=None,
+                       help="SQLite file keeping results between runs")
+    serve.add_argument('--max-pending', type=int, default=64,
+                       help="requests in flight per connection")
+    query = subparsers.add_parser('query',
+                                  help="describe a glyph read from stdin")
+    query.add_argument('address', help="socket path or host:port")
+    query.add_argument('--vertical', action='store_true',
+                       help="glyph runs are vertical")
+    args = parser.parse_args(argv)
+
+    address = parse_address(args.address)
+    if args.command == 'serve':
+        # leave through serve_forever's cleanup on a plain kill as well
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        GlyphService(address, args.processes, args.cache,
+                     args.max_pending).serve_forever()
+        return
+    orientation = VERTICAL if args.vertical else HORIZONTAL
+    with GlyphClient(address) as client:
+        try:
+            response = client.describe(sys.stdin.read(), orientation)
+        except ServiceError, e:
+            sys.exit(str(e))
+    print json.dumps(response)
+
+
+if __name__ == "__main__":
+    main()
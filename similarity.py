@@ -0,0 +1,287 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Nearest-neighbour search over glyph feature vectors.
+
+``feature_vector`` describes a glyph by a fixed number of numbers taken
+from its bounding box, image moments (see ``moments``), convex hull and
+minimum enclosing circle (see ``FEATURES``); most of them do not depend
+on the glyph size. ``SimilarityIndex`` keeps the vectors of known
+glyphs with their labels in a flattened KD-tree and answers exact k-NN
+queries for batches of glyphs. An index is saved to and loaded from a
+``.npz`` file.
+
+Corpus files carry no character labels: the encoding of a row is only
+the orientation flag of its runs. Without a labels file, one label per
+line in corpus order, the command line labels glyphs with that flag.
+
+Usage:
+
+  ``$ python similarity.py build input/glyphs.txt index.npz``
+  ``$ python similarity.py build glyphs.txt index.npz --labels chars.txt``
+  ``$ python similarity.py query index.npz new-glyphs.txt --k 5``
+"""
+
+import argparse
+import collections
+import math
+
+import numpy
+
+import runs
+from algorithm import GlyphConvexHull, LinearEnclosingCircle
+from container import open_corpus
+from moments import Moments
+from settings import HORIZONTAL, VERTICAL
+
+FEATURES = ('width', 'height', 'aspect', 'pixels', 'fill',
+            'centroid_x', 'centroid_y', 'eta20', 'eta02', 'eta11',
+            'hull_size', 'hull_fill', 'circle_fill',
+            'circle_dx', 'circle_dy')
+
+
+def feature_vector(glyph):
+    """Return the ``FEATURES`` of a glyph as a float array."""
+    vector = numpy.zeros(len(FEATURES))
+    level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+    if not len(level):
+        return vector
+    if glyph.orientation == HORIZONTAL:
+        x0, x1 = start.min(), stop.max() - 1
+        y0, y1 = level.min(), level.max()
+    else:
+        x0, x1 = level.min(), level.max()
+        y0, y1 = start.min(), stop.max() - 1
+    width, height = x1 - x0 + 1., y1 - y0 + 1.
+    moments = Moments(glyph)
+    m00 = float(moments.area)
+    cx, cy = moments.centroid
+
+    hull = GlyphConvexHull(glyph).points
+    circle = LinearEnclosingCircle(hull, seed=0).circle
+    hull_area = 0.
+    for first, second in zip(hull, hull[1:] + hull[:1]):
+        hull_area += first.x * second.y - first.y * second.x
+    # pixels are unit squares, their centers span one pixel less
+    hull_area = abs(hull_area) / 2. + 1.
+    radius = circle.r + 0.5
+
+    vector[:] = (width, height, width / height, m00, m00 / (width * height),
+                 (cx - x0 + .5) / width, (cy - y0 + .5) / height,
+                 moments.eta(2, 0), moments.eta(0, 2), moments.eta(1, 1),
+                 len(hull), m00 / hull_area, m00 / (math.pi * radius ** 2),
+                 (circle.x - cx) / radius, (circle.y - cy) / radius)
+    return vector
+
+
+def feature_matrix(glyphs):
+    return numpy.array([feature_vector(glyph) for glyph in glyphs])
+
+
+class SimilarityIndex(object):
+    """
+    Exact k-NN index of feature vectors with labels.
+
+    Vectors are standardized, ``weights`` then scale single features
+    (zero ignores one). The index is a KD-tree flattened into its leaves:
+    vectors are split at the median of their widest feature until at most
+    ``leaf_size`` are left, and every leaf is a contiguous block of the
+    reordered float32 vectors with its bounding box. A query visits leaves
+    in the order of the distance to their boxes and stops as soon as that
+    lower bound exceeds the k-th distance found so far.
+    """
+
+    def __init__(self, vectors, labels, weights=None, leaf_size=1024):
+        vectors = numpy.asarray(vectors, dtype=float).reshape(
+            len(vectors), -1)
+        labels = numpy.asarray(labels)
+        if len(labels) != len(vectors):
+            raise ValueError("Got %i vectors and %i labels" %
+                             (len(vectors), len(labels)))
+        self.mean = vectors.mean(axis=0) if len(vectors) else 0.
+        scale = vectors.std(axis=0) if len(vectors) else 1.
+        scale = numpy.where(scale > 0, scale, 1.)
+        if weights is not None:
+            # a zero weight gives an infinite scale, see transform
+            with numpy.errstate(divide='ignore'):
+                scale = scale / numpy.asarray(weights, dtype=float)
+        self.scale = scale
+        vectors = self.transform(vectors)
+
+        order, bounds = self.split(vectors, leaf_size)
+        self.ids = order
+        self.vectors = vectors[order]
+        self.labels = labels
+        self.starts = numpy.array([start for start, stop in bounds],
+                                  dtype=numpy.int64)
+        self.stops = numpy.array([stop for start, stop in bounds],
+                                 dtype=numpy.int64)
+        if len(bounds):
+            self.lower = numpy.minimum.reduceat(self.vectors, self.starts)
+            self.upper = numpy.maximum.reduceat(self.vectors, self.starts)
+        else:
+            self.lower = self.upper = numpy.zeros((0, vectors.shape[1]))
+
+    def split(self, vectors, leaf_size):
+        """Return the leaf order of vectors and leaves as (start, stop)."""
+        order = numpy.arange(len(vectors))
+        bounds, pending = [], [(0, len(vectors))] if len(vectors) else []
+        while pending:
+            start, stop = pending.pop()
+            if stop - start <= leaf_size:
+                bounds.append((start, stop))
+                continue
+            part = vectors[order[start:stop]]
+            feature = part.ptp(axis=0).argmax()
+            middle = (stop - start) / 2
+            split = numpy.argpartition(part[:, feature], middle)
+            order[start:stop] = order[start:stop][split]
+            pending.append((start + middle, stop))
+            pending.append((start, start + middle))
+        bounds.sort()
+        return order, bounds
+
+    def transform(self, vectors):
+        vectors = numpy.atleast_2d(numpy.asarray(vectors, dtype=float))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            scaled = (vectors - self.mean) / self.scale
+        # a zero weight gives an infinite scale
+        return numpy.nan_to_num(scaled).astype(numpy.float32)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def query(self, vectors, k=1):
+        """
+        Return ``(distances, indices)``, both of shape ``(queries, k)``,
+        of the ``k`` nearest indexed vectors of every query, nearest
+        first. Indices refer to the order the vectors were indexed in.
+        """
+        if k < 1:
+            raise ValueError("Got k=%i, need at least one neighbour" % (k, ))
+        queries = self.transform(vectors).astype(float)
+        k = min(k, len(self))
+        distances = numpy.zeros((len(queries), k))
+        indices = numpy.zeros((len(queries), k), dtype=numpy.int64)
+        for row, query in enumerate(queries):
+            dist2, found = self.query_one(query, k)
+            distances[row] = numpy.sqrt(dist2)
+            indices[row] = self.ids[found]
+        return distances, indices
+
+    def query_one(self, query, k):
+        """Return squared distances and positions of the k nearest."""
+        gap = (numpy.maximum(self.lower - query, 0) +
+               numpy.maximum(query - self.upper, 0))
+        bounds = (gap * gap).sum(axis=1)
+        best_dist = numpy.zeros(0)
+        best = numpy.zeros(0, dtype=numpy.int64)
+        for leaf in numpy.argsort(bounds):
+            if len(best) == k and bounds[leaf] > best_dist[-1]:
+                break
+            start, stop = self.starts[leaf], self.stops[leaf]
+            diff = self.vectors[start:stop] - query
+            dist = numpy.concatenate([best_dist, (diff * diff).sum(axis=1)])
+            found = numpy.concatenate([best, numpy.arange(start, stop)])
+            if len(dist) > k:
+                keep = numpy.argpartition(dist, k - 1)[:k]
+                dist, found = dist[keep], found[keep]
+            order = numpy.argsort(dist)
+            best_dist, best = dist[order], found[order]
+        return best_dist, best
+
+    def classify(self, vectors, k=1):
+        """Return the most common label among the neighbours of each query."""
+        distances, indices = self.query(vectors, k)
+        return self.vote(indices)
+
+    def vote(self, indices):
+        """Return the most common label of every row of ``query`` indices."""
+        result = []
+        for row in indices:
+            votes = collections.Counter(self.labels[row].tolist())
+            result.append(votes.most_common(1)[0][0])
+        return result
+
+    def save(self, path):
+        numpy.savez(path, vectors=self.vectors, labels=self.labels,
+                    ids=self.ids, starts=self.starts, stops=self.stops,
+                    lower=self.lower, upper=self.upper,
+                    mean=self.mean, scale=self.scale)
+
+    @classmethod
+    def load(cls, path):
+        data = numpy.load(path)
+        index = cls.__new__(cls)
+        for name in ('vectors', 'labels', 'ids', 'starts', 'stops',
+                     'lower', 'upper', 'mean', 'scale'):
+            setattr(index, name, data[name])
+        return index
+
+
+def build_index(records, weights=None, labels=None):
+    """
+    Index corpus records by their features. Records are labelled with
+    ``labels`` in their order, by default with their encodings, which
+    in corpus files are the orientation flags.
+    """
+    vectors, encodings = [], []
+    for record in records:
+        vectors.append(feature_vector(record.glyph))
+        encodings.append(record.encoding)
+    if labels is None:
+        labels = encodings
+    return SimilarityIndex(numpy.array(vectors).reshape(-1, len(FEATURES)),
+                           labels, weights)
+
+
+def read_labels(path):
+    """Return the labels of a file with one label per line."""
+    with open(path) as stream:
+        return [line.strip() for line in stream]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Find similar glyphs by their feature vectors.")
+    subparsers = parser.add_subparsers(dest='command')
+    build = subparsers.add_parser('build', help="index a corpus")
+    build.add_argument('corpus')
+    build.add_argument('index')
+    query = subparsers.add_parser('query', help="classify corpus glyphs")
+    query.add_argument('index')
+    query.add_argument('corpus')
+    query.add_argument('--k', type=int, default=5)
+    for subparser in (build, query):
+        subparser.add_argument('--horizontal', action='store_true',
+                               help="rows without an orientation "
+                                    "flag are horizontal")
+        subparser.add_argument('--labels', metavar='PATH', default=None,
+                               help="one label per corpus glyph (default: "
+                                    "its orientation flag)")
+    args = parser.parse_args(argv)
+
+    labels = None if args.labels is None else read_labels(args.labels)
+    orientation = HORIZONTAL if args.horizontal else VERTICAL
+    with open_corpus(args.corpus, orientation) as corpus:
+        if labels is not None and len(labels) != len(corpus):
+            parser.error("Got %i labels for %i glyphs" %
+                         (len(labels), len(corpus)))
+        if args.command == 'build':
+            build_index(corpus, labels=labels).save(args.index)
+            return
+        index = SimilarityIndex.load(args.index)
+        records = list(corpus)
+    if labels is None:
+        labels = [record.encoding for record in records]
+    vectors = feature_matrix([record.glyph for record in records])
+    distances, indices = index.query(vectors, args.k)
+    votes = index.vote(indices)
+    for known, label, row, dist in zip(labels, votes, indices, distances):
+        neighbours = ' '.join('%s:%.3f' % (index.labels[i], d)
+                              for i, d in zip(row, dist))
+        print '%s\t%s\t%s' % (known, label, neighbours)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,36 @@
 Authors: Nastia Merlits, Kostia Balitsky
 """
 
+import bisect
+import itertools
+
+import numpy
+
+import geometry
 from settings import HORIZONTAL, VERTICAL, EPS
 
 
-class Point(object):
+class _Slotted(object):
+    """Base of the small value types, keeps them picklable with slots."""
+
+    __slots__ = ()
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        # pickles made before the slots hold the instance __dict__
+        if isinstance(state, dict):
+            state = state.items()
+        else:
+            state = zip(self.__slots__, state)
+        for name, value in state:
+            setattr(self, name, value)
+
+
+class Point(_Slotted):
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -27,21 +53,24 @@ class Point(object):
             return Point(self.x * other, self.y * other)
 
 
-class Circle(object):
+class Circle(_Slotted):
+    __slots__ = ('x', 'y', 'r')
+
     def __init__(self, x, y, r):
         self.x = x
         self.y = y
         self.r = r
 
     def __contains__(self, point):
-        return (self.r ** 2 -
-                ((point.x - self.x) ** 2 + (point.y - self.y) ** 2)) > -EPS
+        return geometry.incircle(self.x, self.y, self.r, point.x, point.y)
 
     def __repr__(self):
         return "<Circle: (%r, %r), %r>" % (self.x, self.y, self.r)
 
 
-class Line(object):
+class Line(_Slotted):
+    __slots__ = ('x', 'y', 'l')
+
     def __init__(self, x=0, y=0, l=0):
         self.x = x
         self.y = y
@@ -63,23 +92,125 @@ class Line(object):
             self.l = value
 
 
+class LineView(object):
+    """
+    Read-only sequence of ``Line`` objects over the columns of a glyph.
+
+    Lines are built on access, so iterating over the view costs one small
+    object per line instead of keeping all of them resident.
+    """
+
+    def __init__(self, glyph):
+        self.glyph = glyph
+
+    def __len__(self):
+        return len(self.glyph)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in xrange(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("line index out of range")
+        data = self.glyph._data
+        return Line(int(data[0, item]), int(data[1, item]),
+                    int(data[2, item]))
+
+    def __iter__(self):
+        for x, y, l in itertools.izip(self.glyph.x.tolist(),
+                                      self.glyph.y.tolist(),
+                                      self.glyph.l.tolist()):
+            yield Line(x, y, l)
+
+
 class Glyph(object):
-    def __init__(self, orientation):
+    """
+    Set of lines (runs) of the same orientation.
+
+    Lines are stored column-wise in a single ``int32`` array; ``x``, ``y``
+    and ``l`` are zero-copy views of its rows and ``lines`` is a lazy
+    compatibility view producing ``Line`` objects.
+    """
+
+    DTYPE = numpy.int32
+
+    def __init__(self, orientation, capacity=16):
         self.orientation = orientation
-        self.lines = []
+        self._data = numpy.empty((3, max(capacity, 1)), dtype=self.DTYPE)
+        self._size = 0
+
+    @classmethod
+    def from_arrays(cls, orientation, x, y, l):
+        """Build a glyph from three equally sized sequences of integers."""
+        data = numpy.array([x, y, l], dtype=cls.DTYPE).reshape(3, -1)
+        glyph = cls(orientation, capacity=data.shape[1])
+        glyph._data[:, :data.shape[1]] = data
+        glyph._size = data.shape[1]
+        return glyph
+
+    def _reserve(self, size):
+        capacity = self._data.shape[1]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        data = numpy.empty((3, capacity), dtype=self.DTYPE)
+        data[:, :self._size] = self._data[:, :self._size]
+        self._data = data
 
     def add_line(self, line):
-        self.lines.append(line)
+        self._reserve(self._size + 1)
+        self._data[:, self._size] = (line.x, line.y, line.l)
+        self._size += 1
+
+    def remove_line(self, index):
+        """Remove a line by its index and return it."""
+        line = self.lines[index]
+        if index < 0:
+            index += self._size
+        data = self._data
+        data[:, index:self._size - 1] = data[:, index + 1:self._size]
+        self._size -= 1
+        return line
+
+    def extend(self, x, y, l):
+        """Append lines given as three equally sized sequences."""
+        data = numpy.array([x, y, l], dtype=self.DTYPE).reshape(3, -1)
+        self._reserve(self._size + data.shape[1])
+        self._data[:, self._size:self._size + data.shape[1]] = data
+        self._size += data.shape[1]
+
+    @property
+    def x(self):
+        return self._data[0, :self._size]
+
+    @property
+    def y(self):
+        return self._data[1, :self._size]
+
+    @property
+    def l(self):
+        return self._data[2, :self._size]
+
+    @property
+    def lines(self):
+        return LineView(self)
+
+    def __len__(self):
+        return self._size
 
     def __repr__(self):
         return "<%s-Glyph object with %i lines>" %\
                 ('H' if self.orientation == HORIZONTAL else 'V',
-                len(self.lines), )
+                self._size, )
 
 
-class Segment(object):
+class Segment(_Slotted):
     """Represent one-dimentional segment"""
 
+    __slots__ = ('start', 'end')
+
     def __init__(self, start, end):
         self.start = start
         self.end = end
@@ -120,88 +251,121 @@ class SegmentSequence(object):
     Represent ordered set of one-dimentional disjoint non-adjacent segments.
 
     This data structure maintains a set of 1D segmens and allows
-    one to add an arbitrary point to this set. If the added point lays
-    inside of one of the segments, the set remains unchanged. If the point
-    is adjacent to one of the segments, the segment extends to include the
-    point. Finally, if the point is not adjacent to any segment, the new
-    segment containing this point only is created in appropriate place.
+    one to add an arbitrary point or interval to this set. Everything
+    already covered by the set stays unchanged, segments overlapping or
+    adjacent to the added interval are merged with it, otherwise a new
+    segment is created in appropriate place.
 
     Thus the set of segments is always ordered. Moreover, no two neighbour
     segments are adjacent on a line: if one ends in x, the next one starts
     no earlier than x+2.
+
+    Segment boundaries are mirrored in two sorted lists, so affected
+    segments are found by binary search and replaced in place with a
+    single slice assignment.
     """
 
     def __init__(self, satellite=None):
         self.satellite = satellite
         self.segments = []
+        self._starts = []
+        self._ends = []
 
-    def _try_to_add_external(self, point):
+    @classmethod
+    def from_intervals(cls, intervals, satellite=None):
         """
-        Try to add a point if it is not in the boundaries of a current
-        segment set.
+        Build a sequence from an unordered iterable of (start, end)
+        intervals, ends included.
         """
-        if not self.segments:
-            self.segments = [Segment(point, point)]
-            return True
-        if self.segments[-1] < point:
-            if self.segments[-1].adjacent(point):
-                self.segments[-1].extend(point)
-            else:
-                self.segments += [Segment(point, point)]
-            return True
-        if self.segments[0] > point:
-            if self.segments[0].adjacent(point):
-                self.segments[0].extend(point)
+        sequence = cls(satellite)
+        sequence.load(intervals)
+        return sequence
+
+    def load(self, intervals):
+        """Add many (start, end) intervals at once: sort and merge in one
+        pass instead of inserting them one by one.
+        """
+        intervals = sorted(list(intervals) +
+                           zip(self._starts, self._ends))
+        starts, ends = [], []
+        for start, end in intervals:
+            if start > end:
+                continue
+            if ends and start <= ends[-1] + 1:
+                if end > ends[-1]:
+                    ends[-1] = end
             else:
-                self.segments = [Segment(point, point)] + self.segments
-            return True
-        return False
+                starts.append(start)
+                ends.append(end)
+        self._starts, self._ends = starts, ends
+        self.segments = [Segment(start, end)
+                            for start, end in zip(starts, ends)]
 
     def add_point(self, point):
         """Add a new point to the set of segments."""
-        if self._try_to_add_external(point):
+        self.add_interval(point, point)
+
+    def add_interval(self, start, end):
+        """Add all points from ``start`` to ``end`` inclusive."""
+        if start > end:
             return
+        # segments in [left, right) overlap or touch the new interval
+        left = bisect.bisect_left(self._ends, start - 1)
+        right = bisect.bisect_right(self._starts, end + 1)
+        if left < right:
+            if self._starts[left] <= start and end <= self._ends[left]:
+                return
+            start = min(start, self._starts[left])
+            end = max(end, self._ends[right - 1])
+        self._starts[left:right] = [start]
+        self._ends[left:right] = [end]
+        self.segments[left:right] = [Segment(start, end)]
+
+    def _find(self, point):
+        """Return index of a segment containing ``point`` or -1."""
+        index = bisect.bisect_left(self._ends, point)
+        if index < len(self._starts) and self._starts[index] <= point:
+            return index
+        return -1
 
-        left = 0
-        right = len(self.segments) - 1
-        while right - left > 1:
-            mid = (left + right) / 2
-            if point in self.segments[mid]:
-                left = right = mid
-                break
-            elif self.segments[mid] > point:
-                right = mid
-            else:
-                left = mid
+    def __contains__(self, point):
+        """Check whether point is covered by one of the segments"""
+        return self._find(point) != -1
 
-        if left < right:
-            self.segments = (self.segments[:left + 1] +
-                        [Segment(point, point)] + self.segments[right:])
-            self._try_to_merge(left, left + 1)
-            self._try_to_merge(left, left + 1)
-            self._try_to_merge(right, right + 1)
+    def covers(self, start, end):
+        """Check whether all points from ``start`` to ``end`` are in the
+        set, that is whether they lay inside of a single segment.
+        """
+        index = self._find(start)
+        return index != -1 and end <= self._ends[index]
+
+    def overlaps(self, start, end):
+        """Check whether any point from ``start`` to ``end`` is in the set."""
+        index = bisect.bisect_left(self._ends, start)
+        return index < len(self._starts) and self._starts[index] <= end
 
     def __repr__(self):
         return "<SegSeq: %r, %r>" %\
-            ([(seg.start, seg.end) for seg in self.segments], self.satellite)
+            (zip(self._starts, self._ends), self.satellite)
 
     def __iter__(self):
         return iter(self.segments)
 
-    def _try_to_merge(self, ind1, ind2):
-        """
-        Try to merge segments with indices ``ind1`` and ``ind2``
-        into one and return True. Otherwise, return False.
-        """
-        if ind2 < len(self.segments) and\
-                        self.segments[ind1].adjacent(self.segments[ind2]):
-            self._merge(ind1, ind2)
-            return True
-        return False
-
-    def _merge(self, ind1, ind2):
-        """Merge segments with indices ``ind1`` and ``ind2``."""
-        self.segments = (self.segments[:ind1] +
-                        [Segment(self.segments[ind1].start,
-                                 self.segments[ind2].end)] +
-                        self.segments[ind2 + 1:])
+    def __len__(self):
+        return len(self.segments)
+
+
+class GlyphRecord(object):
+    """One row of a glyph corpus: a labelled glyph with its precomputed
+    bounding box and enclosing circle.
+    """
+
+    def __init__(self, encoding, bbox, circle, glyph):
+        self.encoding = encoding
+        self.bbox = bbox
+        self.circle = circle
+        self.glyph = glyph
+
+    def __repr__(self):
+        return "<GlyphRecord: %r, %r, %r, %r>" %\
+            (self.encoding, self.bbox, self.circle, self.glyph)
@@ -0,0 +1,168 @@
+"""
+Authors: Nastia Merlits, Kostia Balitsky
+
+Affine transforms of run-encoded glyphs.
+
+A point ``p`` goes to ``matrix * p + offset``; pixels are unit squares
+centered at integer coordinates. The output is sampled at pixel centers:
+an output pixel is set when its center maps back into a set source
+pixel. A source run covers a box in source coordinates, its image is a
+parallelogram, and the output pixels of a row inside of a parallelogram
+form one interval found from two linear inequalities. So every output
+row gets its runs straight from the source runs crossing it, without
+building a bitmap; the cost follows the number of (source run, output
+row) pairs.
+
+``downscale`` shrinks by an integer factor without sampling: an output
+pixel is set when its block holds enough set source pixels.
+"""
+
+import math
+
+import numpy
+
+import runs
+from settings import HORIZONTAL
+
+_FAR = 1 << 40
+
+
+def _permutation(orientation):
+    """Matrix mapping (level, position) coordinates onto (x, y)."""
+    if orientation == HORIZONTAL:
+        return numpy.array([[0., 1.], [1., 0.]])
+    return numpy.eye(2)
+
+
+def _interval(coefficient, constant, low, high):
+    """
+    Return integer bounds ``[first, stop)`` of ``t`` satisfying
+    ``low <= coefficient * t + constant < high``, element-wise.
+    """
+    first = numpy.empty(len(constant), dtype=runs.DTYPE)
+    stop = numpy.empty(len(constant), dtype=runs.DTYPE)
+    if abs(coefficient) > 1e-12:
+        low = numpy.clip((low - constant) / coefficient, -_FAR, _FAR)
+        high = numpy.clip((high - constant) / coefficient, -_FAR, _FAR)
+        if coefficient > 0:
+            first[:], stop[:] = numpy.ceil(low), numpy.ceil(high)
+        else:
+            first[:], stop[:] = numpy.floor(high) + 1, numpy.floor(low) + 1
+    else:
+        inside = (low <= constant) & (constant < high)
+        first[:] = numpy.where(inside, -_FAR, 0)
+        stop[:] = numpy.where(inside, _FAR, 0)
+    return first, stop
+
+
+def affine(glyph, matrix, offset=(0., 0.), orientation=None):
+    """
+    Return the glyph transformed by an affine map, with runs of the
+    given ``orientation`` (that of the glyph by default).
+    """
+    if orientation is None:
+        orientation = glyph.orientation
+    matrix = numpy.asarray(matrix, dtype=float)
+    source_p = _permutation(glyph.orientation)
+    target_p = _permutation(orientation)
+    # the same map in (level, position) coordinates on both sides
+    forward = target_p.dot(matrix).dot(source_p)
+    shift = target_p.dot(numpy.asarray(offset, dtype=float))
+    if abs(numpy.linalg.det(forward)) < 1e-12:
+        raise ValueError("Affine map %r is singular" % (matrix.tolist(), ))
+    inverse = numpy.linalg.inv(forward)
+
+    level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+    if not len(level):
+        return runs.to_glyph(orientation, *runs.empty())
+    # source boxes [level - .5, level + .5) x [start - .5, stop - .5)
+    box_low = numpy.column_stack([level - .5, start - .5])
+    box_high = numpy.column_stack([level + .5, stop - .5])
+    corners = numpy.array([
+        numpy.column_stack([box_low[:, 0], box_low[:, 1]]),
+        numpy.column_stack([box_low[:, 0], box_high[:, 1]]),
+        numpy.column_stack([box_high[:, 0], box_low[:, 1]]),
+        numpy.column_stack([box_high[:, 0], box_high[:, 1]])])
+    rows = corners.dot(forward[0]) + shift[0]
+    first_row = numpy.ceil(rows.min(axis=0)).astype(runs.DTYPE)
+    last_row = numpy.floor(rows.max(axis=0)).astype(runs.DTYPE)
+
+    index, row = runs.expand(first_row, last_row + 1)
+    relative = row - shift[0]
+    # both source coordinates are linear in the output position
+    result_start = numpy.repeat(-_FAR, len(index))
+    result_stop = numpy.repeat(_FAR, len(index))
+    for axis in (0, 1):
+        constant = inverse[axis, 0] * relative - inverse[axis, 1] * shift[1]
+        first, last = _interval(inverse[axis, 1], constant,
+                                box_low[index, axis], box_high[index, axis])
+        result_start = numpy.maximum(result_start, first)
+        result_stop = numpy.minimum(result_stop, last)
+    return runs.to_glyph(orientation, *runs.normalize(row, result_start,
+                                                      result_stop))
+
+
+def scale(glyph, sx, sy=None, orientation=None):
+    """Scale about the origin."""
+    sy = sx if sy is None else sy
+    return affine(glyph, [[sx, 0.], [0., sy]], orientation=orientation)
+
+
+def rotate(glyph, angle, center=(0., 0.), orientation=None):
+    """Rotate counterclockwise by ``angle`` radians about ``center``."""
+    cos, sin = math.cos(angle), math.sin(angle)
+    matrix = numpy.array([[cos, -sin], [sin, cos]])
+    center = numpy.asarray(center, dtype=float)
+    return affine(glyph, matrix, center - matrix.dot(center), orientation)
+
+
+def shear(glyph, kx, ky=0., orientation=None):
+    """Map (x, y) to (x + kx * y, y + ky * x)."""
+    return affine(glyph, [[1., kx], [ky, 1.]], orientation=orientation)
+
+
+def fit(glyph, size, orientation=None):
+    """
+    Scale a glyph uniformly so that its bounding box fits ``size`` x
+    ``size`` pixels with its corner at the origin.
+    """
+    x, y, l = glyph.x, glyph.y, glyph.l
+    if not len(x):
+        return affine(glyph, numpy.eye(2), orientation=orientation)
+    if glyph.orientation == HORIZONTAL:
+        x0, x1, y0, y1 = x.min(), (x + l).max() - 1, y.min(), y.max()
+    else:
+        x0, x1, y0, y1 = x.min(), x.max(), y.min(), (y + l).max() - 1
+    factor = float(size) / max(x1 - x0 + 1, y1 - y0 + 1)
+    # the outer pixel edges x0 - .5 and y0 - .5 go to -.5
+    offset = (factor * (.5 - x0) - .5, factor * (.5 - y0) - .5)
+    return affine(glyph, [[factor, 0.], [0., factor]], offset, orientation)
+
+
+def downscale(glyph, factor, min_pixels=1):
+    """
+    Shrink a glyph by an integer factor: output pixel (X, Y) stands for
+    the source block ``[factor * X, factor * X + factor)`` along both
+    axes and is set when at least ``min_pixels`` of the block are set.
+
+    With ``min_pixels=1`` only the runs are scaled, otherwise pixels
+    are counted per block and per source run.
+    """
+    level, start, stop = runs.normalize(*runs.from_glyph(glyph))
+    if min_pixels <= 1 or not len(level):
+        return runs.to_glyph(glyph.orientation, *runs.normalize(
+            level // factor, start // factor, (stop - 1) // factor + 1))
+
+    first, last = start // factor, (stop - 1) // factor + 1
+    index, block = runs.expand(first, last)
+    covered = (numpy.minimum(stop[index], (block + 1) * factor) -
+               numpy.maximum(start[index], block * factor))
+    # sum pixels of all source runs falling into the same output cell
+    base = block.min()
+    span = block.max() - base + 1
+    key = (level[index] // factor) * span + (block - base)
+    cells, inverse = numpy.unique(key, return_inverse=True)
+    counts = numpy.bincount(inverse, weights=covered)
+    cell_level, cell_pos = numpy.divmod(cells[counts >= min_pixels], span)
+    return runs.to_glyph(glyph.orientation, *runs.normalize(
+        cell_level, cell_pos + base, cell_pos + base + 1))